@@ -0,0 +1,237 @@
+import argparse
+import concurrent.futures
+import math
+import multiprocessing
+import os
+import resource
+import tempfile
+import time
+
+import duckdb
+import pandas as pd
+
+import connected_components as cc
+import generate_random_graphs as gen
+import validation
+
+# Benchmarks of the clustering algorithms across graph families and sizes.
+#
+# Each run happens in a fresh process, so that its peak memory can be
+# measured, and reads its graph from Parquet files written once per graph.
+# Results are written to a summary report with a row per run, and a second
+# report with a row per iteration of each run, and a third with a row per SQL
+# statement in each iteration, e.g.
+#
+#   python benchmark.py --sizes 1000 100000 --output benchmark_results.csv
+
+# The match_probability threshold used for each graph family.  The families
+# named after generate_random_graphs.SHAPES are generated in chunks, so can
+# be used at much larger sizes than the others.
+GRAPH_FAMILIES = {
+    "chain": None,
+    "gnp": None,
+    "uniform": 0.5,
+    "power_law": 0.5,
+    "giant_component": 0.5,
+    "chain_blobs": None,
+}
+
+
+def make_graph(family, num_edges, seed=42):
+    """Generate a graph from `family` with approximately `num_edges` edges."""
+    if family == "chain":
+        return gen.generate_chain_graph(num_edges + 1, seed)
+    if family == "gnp":
+        # generate_graph links each pair of nodes with probability 0.001
+        return gen.generate_graph(int(math.sqrt(2 * num_edges / 0.001)), seed)
+    raise ValueError(
+        f"Unknown graph family {family!r}, expected one of {', '.join(GRAPH_FAMILIES)}"
+    )
+
+
+def write_graph(family, num_edges, graph_path, seed=42):
+    """Write a graph from `family` to Parquet files under `graph_path`.
+
+    Returns the number of nodes and edges written.
+    """
+    if family in gen.SHAPES:
+        gen.write_graph_to_parquet(
+            graph_path,
+            num_nodes=num_edges // 2,
+            shape=family,
+            num_edges=num_edges,
+            master_seed=seed,
+        )
+    else:
+        nodes, edges = make_graph(family, num_edges, seed)
+        os.makedirs(os.path.join(graph_path, "edges"))
+        _write(nodes, f"{graph_path}/nodes.parquet")
+        _write(edges, f"{graph_path}/edges/part-00000.parquet")
+
+    nodes_path = cc._quote(f"{graph_path}/nodes.parquet")
+    edges_path = cc._quote(f"{graph_path}/edges/*.parquet")
+    con = duckdb.connect()
+    return con.execute(f"""
+    SELECT
+        (SELECT COUNT(*) FROM read_parquet({nodes_path})),
+        (SELECT COUNT(*) FROM read_parquet({edges_path}))
+    """).fetchone()
+
+
+def _copy_format(path):
+    return "PARQUET" if path.endswith(".parquet") else "CSV"
+
+
+def _write(df, path):
+    con = duckdb.connect()
+    con.register("report", df)
+    con.execute(f"COPY report TO {cc._quote(path)} (FORMAT {_copy_format(path)})")
+
+
+def _run_one(algorithm, graph_path, threshold, profile, validate):
+    """Cluster one graph with one algorithm.  Runs in its own process."""
+    con = duckdb.connect()
+    nodes_path = cc._quote(f"{graph_path}/nodes.parquet")
+    edges_path = cc._quote(f"{graph_path}/edges/*.parquet")
+    con.execute(f"CREATE TABLE nodes AS SELECT * FROM read_parquet({nodes_path})")
+    con.execute(f"CREATE TABLE edges AS SELECT * FROM read_parquet({edges_path})")
+
+    metrics = []
+    start_time = time.perf_counter()
+    clusters = cc.cluster(
+        "nodes",
+        "edges",
+        threshold,
+        algorithm=algorithm,
+        con=con,
+        metrics=metrics,
+        profile=profile,
+    )
+    wall_time = time.perf_counter() - start_time
+
+    summary = {
+        "wall_time": wall_time,
+        "iterations": len(metrics),
+        "clusters": clusters["cluster_id"].nunique(),
+        # ru_maxrss is in kilobytes on Linux
+        "peak_memory_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+    if profile:
+        rows_scanned = [m["rows_scanned"] for m in metrics]
+        summary["rows_scanned"] = sum(rows_scanned)
+        summary["mean_rows_scanned_per_iteration"] = (
+            sum(rows_scanned) / len(rows_scanned) if rows_scanned else 0
+        )
+    if validate:
+        summary["valid"] = validation.validate(
+            clusters, "nodes", "edges", threshold, con=con
+        )["match"]
+    return summary, metrics
+
+
+def run_benchmarks(
+    algorithms=cc.ALGORITHMS,
+    families=tuple(GRAPH_FAMILIES),
+    sizes=(1_000, 10_000, 100_000),
+    output="benchmark_results.csv",
+    profile=True,
+    validate=False,
+    seed=42,
+):
+    """Run every algorithm on every graph family at every size (in edges).
+
+    Writes a summary report to `output`, as CSV or as Parquet if it ends in
+    .parquet, the per-iteration metrics alongside it with an `_iterations`
+    suffix, and the time taken by each SQL statement in each iteration with
+    a `_statements` suffix.  Returns the summary as a DataFrame.
+
+    Peak memory is the peak resident set size of the process running the
+    benchmark, so includes the graph itself.
+    """
+    runs = []
+    iterations = []
+    statements = []
+    context = multiprocessing.get_context("spawn")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for family in families:
+            for size in sizes:
+                graph_path = os.path.join(tmp_dir, f"{family}_{size}")
+                num_nodes, num_edges = write_graph(family, size, graph_path, seed)
+
+                for algorithm in algorithms:
+                    print(f"Running {algorithm} on {family} graph with {size} edges")
+                    with concurrent.futures.ProcessPoolExecutor(
+                        max_workers=1, mp_context=context
+                    ) as executor:
+                        summary, metrics = executor.submit(
+                            _run_one,
+                            algorithm,
+                            graph_path,
+                            GRAPH_FAMILIES[family],
+                            profile,
+                            validate,
+                        ).result()
+
+                    run = {
+                        "algorithm": algorithm,
+                        "family": family,
+                        "size": size,
+                        "nodes": num_nodes,
+                        "edges": num_edges,
+                    }
+                    runs.append({**run, **summary})
+                    for m in metrics:
+                        iteration = {k: v for k, v in m.items() if k != "statements"}
+                        iterations.append({**run, **iteration})
+                        statements.extend(
+                            {
+                                **run,
+                                "iteration": m["iteration"],
+                                **{
+                                    k: v
+                                    for k, v in statement.items()
+                                    if k != "operator_timing"
+                                },
+                            }
+                            for statement in m["statements"]
+                        )
+                    print(
+                        f"  {summary['wall_time']:.2f} seconds, "
+                        f"{summary['iterations']} iterations"
+                    )
+
+    results = pd.DataFrame(runs)
+    _write(results, output)
+    stem, extension = os.path.splitext(output)
+    if iterations:
+        _write(pd.DataFrame(iterations), f"{stem}_iterations{extension}")
+    if statements:
+        _write(pd.DataFrame(statements), f"{stem}_statements{extension}")
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--algorithms", nargs="+", default=list(cc.ALGORITHMS))
+    parser.add_argument("--families", nargs="+", default=list(GRAPH_FAMILIES))
+    parser.add_argument(
+        "--sizes", nargs="+", type=int, default=[1_000, 10_000, 100_000]
+    )
+    parser.add_argument("--output", default="benchmark_results.csv")
+    parser.add_argument("--no-profile", dest="profile", action="store_false")
+    parser.add_argument("--validate", action="store_true")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    print(
+        run_benchmarks(
+            args.algorithms,
+            args.families,
+            args.sizes,
+            args.output,
+            args.profile,
+            args.validate,
+            args.seed,
+        )
+    )
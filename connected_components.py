@@ -0,0 +1,1469 @@
+import json
+import logging
+import random
+import re
+import time
+import uuid
+
+import duckdb
+import numpy as np
+
+import in_memory
+
+# Importable connected-components engine.
+#
+# The top-level scripts in this repo (union_find.py, union_find_with_active.py,
+# union_find_with_edge_compression.py, randomised_contraction_fast.py) each
+# prototype one algorithm against the global duckdb connection.  This module
+# collects those algorithms behind a single `cluster` function so they can be
+# benchmarked and embedded without running a demo on import.
+#
+# Every run works in its own namespace of tables (see _Workspace), which are
+# dropped when the run finishes, so repeated runs on a shared connection don't
+# see each other's intermediate tables.
+
+logger = logging.getLogger(__name__)
+
+
+class _Workspace:
+    """Namespaced working tables for a single clustering run on a connection.
+
+    At the end of each iteration a dict of statistics is built, with the time
+    taken by each SQL statement run in the iteration.  It is appended to
+    `metrics` if that is a list, and passed to `on_iteration` if given.  With
+    `profile`, DuckDB's profiler is enabled so these also include the rows
+    scanned and the time spent in each operator, as EXPLAIN ANALYZE reports.
+
+    With a `run_id`, the tables are named after it rather than at random, and
+    the changes made by each iteration are committed in one transaction
+    along with the state needed to resume after it (see `begin` and
+    `checkpoint`).  On a file-backed database, a run which is interrupted can
+    then be resumed by starting it again with the same `run_id`.
+    """
+
+    def __init__(
+        self, con, metrics=None, profile=False, on_iteration=None, run_id=None
+    ):
+        self.con = con
+        if run_id is None:
+            self.prefix = f"__cc_{uuid.uuid4().hex[:8]}_"
+        elif re.fullmatch(r"\w+", run_id):
+            self.prefix = f"__cc_{run_id}_"
+        else:
+            raise ValueError(
+                f"run_id {run_id!r} must only contain letters, digits and underscores"
+            )
+        self.resumable = run_id is not None
+        self.algorithm = None
+        self.metrics = metrics
+        self.profile = profile
+        self.on_iteration = on_iteration
+        self.start_iteration()
+        if profile:
+            self.con.execute("SET enable_profiling = 'no_output'")
+            self.con.execute("SET profiling_coverage = 'ALL'")
+            self.con.execute(
+                """SET custom_profiling_settings = '{"CUMULATIVE_ROWS_SCANNED": "true", "OPERATOR_TIMING": "true", "OPERATOR_NAME": "true"}'"""
+            )
+
+    def table(self, name):
+        return f"{self.prefix}{name}"
+
+    def _statement_name(self, sql):
+        # e.g. "create updated_representatives" or "update representatives"
+        keyword = sql.split(None, 1)[0].lower()
+        table = re.search(rf"{re.escape(self.prefix)}(\w+)", sql)
+        return f"{keyword} {table.group(1)}" if table else keyword
+
+    def execute(self, sql, name=None):
+        """Run `sql`, recording its timings under `name` for the iteration.
+
+        `name` defaults to the statement's first keyword and the first
+        working table it mentions.
+        """
+        start = time.perf_counter()
+        result = self.con.execute(sql)
+        statement = {
+            "statement": name or self._statement_name(sql),
+            "elapsed": time.perf_counter() - start,
+        }
+        if self.profile:
+            profile = json.loads(self.con.get_profiling_information(format="json"))
+            statement["rows_scanned"] = profile.get("cumulative_rows_scanned", 0)
+            statement["operator_timing"] = {}
+            _operator_timings(profile, statement["operator_timing"])
+        self._statements.append(statement)
+        return result
+
+    def start_iteration(self):
+        self._iteration_start = time.perf_counter()
+        self._statements = []
+
+    def end_iteration(self, iteration, **counts):
+        """Record the statistics for an iteration, e.g. the number of changes."""
+        if self.metrics is None and self.on_iteration is None:
+            return
+        record = {
+            "iteration": iteration,
+            **counts,
+            "elapsed": time.perf_counter() - self._iteration_start,
+        }
+        if self.profile:
+            record["rows_scanned"] = sum(s["rows_scanned"] for s in self._statements)
+        record["statements"] = self._statements
+        if self.metrics is not None:
+            self.metrics.append(record)
+        if self.on_iteration is not None:
+            self.on_iteration(record)
+
+    def register(self, name, obj):
+        """Expose an input as `name`.
+
+        `obj` can be a DataFrame, an Arrow table, a DuckDB relation on this
+        connection, the name of a table, or the path of a Parquet file, which
+        may contain a glob such as `edges/*.parquet`.  Parquet files are
+        scanned where they are rather than loaded first.
+        """
+        table = self.table(name)
+        if isinstance(obj, str):
+            if obj.endswith(".parquet"):
+                obj = f"read_parquet({_quote(obj)})"
+            self.con.execute(f"CREATE OR REPLACE VIEW {table} AS SELECT * FROM {obj}")
+        else:
+            self.con.register(table, obj)
+        return table
+
+    def saved_state(self):
+        """The state saved by the last checkpoint of a resumable run, if any."""
+        if not self.resumable:
+            return None
+        (exists,) = self.con.execute(
+            """
+            SELECT COUNT(*)
+            FROM information_schema.tables
+            WHERE table_name = ?
+            """,
+            [self.table("state")],
+        ).fetchone()
+        if not exists:
+            return None
+        (state,) = self.con.execute(
+            f"SELECT state FROM {self.table('state')}"
+        ).fetchone()
+        return json.loads(state)
+
+    def begin(self):
+        """Start the transaction for an iteration of a resumable run.
+
+        Statements which only create new tables are redone harmlessly if an
+        iteration is interrupted, so the transaction starts at the first
+        statement which changes a table the iteration read.  The queries
+        before it then see committed tables, which DuckDB has cardinality
+        estimates for; it has none for tables created in an open
+        transaction, and can pick very poor join orders without them.
+        """
+        if self.resumable:
+            self.con.execute("BEGIN TRANSACTION")
+
+    def checkpoint(self, **state):
+        """Commit an iteration of a resumable run together with the `state`
+        needed to resume after it, and checkpoint the database file."""
+        if not self.resumable:
+            return
+        self.con.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table('state')} (state VARCHAR)"
+        )
+        self.con.execute(f"DELETE FROM {self.table('state')}")
+        self.con.execute(
+            f"INSERT INTO {self.table('state')} VALUES (?)",
+            [json.dumps({"algorithm": self.algorithm, **state})],
+        )
+        self.con.execute("COMMIT")
+        self.con.execute("CHECKPOINT")
+
+    def rollback(self):
+        """Abandon the iteration in progress, if any, leaving the last
+        checkpoint to resume from."""
+        try:
+            self.con.execute("ROLLBACK")
+        except duckdb.Error:
+            # No transaction was open
+            pass
+
+    def replace(self, table, new_table):
+        """Drop `table` and rename `new_table` to take its place."""
+        self.con.execute(f"DROP TABLE {table}")
+        self.con.execute(f"ALTER TABLE {new_table} RENAME TO {table}")
+
+    def cleanup(self):
+        working = self.con.execute(
+            """
+            SELECT table_name, table_type
+            FROM information_schema.tables
+            WHERE starts_with(table_name, ?)
+            """,
+            [self.prefix],
+        ).fetchall()
+        for name, table_type in working:
+            if table_type == "VIEW":
+                self.con.execute(f"DROP VIEW IF EXISTS {name}")
+            else:
+                self.con.execute(f"DROP TABLE IF EXISTS {name}")
+
+        if self.profile:
+            self.con.execute("RESET enable_profiling")
+            self.con.execute("RESET profiling_coverage")
+            self.con.execute("RESET custom_profiling_settings")
+
+        macros = self.con.execute(
+            """
+            SELECT DISTINCT function_name
+            FROM duckdb_functions()
+            WHERE function_type = 'macro' AND starts_with(function_name, ?)
+            """,
+            [self.prefix],
+        ).fetchall()
+        for (name,) in macros:
+            self.con.execute(f"DROP MACRO IF EXISTS temp.main.{name}")
+
+
+def _operator_timings(profile, totals):
+    """Sum the time spent in each operator of a profiler tree into `totals`."""
+    for child in profile.get("children", []):
+        name = child.get("operator_name")
+        if name:
+            totals[name] = totals.get(name, 0) + child.get("operator_timing", 0)
+        _operator_timings(child, totals)
+
+
+def _quote(value):
+    """`value` as a SQL string literal."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+def _fetch(ws, query, output=None):
+    """Run `query`, returning its result as a DataFrame, or with an `output`
+    path, writing it straight to that Parquet file with COPY and returning
+    the path."""
+    if output is None:
+        return ws.execute(query).df()
+    ws.execute(f"COPY ({query}) TO {_quote(output)} (FORMAT PARQUET)")
+    return output
+
+
+def _threshold_filter(threshold):
+    if threshold is None:
+        return ""
+    return f"AND match_probability >= {threshold}"
+
+
+def _create_neighbours(ws, threshold):
+    """Build the symmetric `neighbours` table, including a self-loop per node."""
+    nodes = ws.table("nodes")
+    edges_without_self_loops = ws.table("edges_without_self_loops")
+    edges = ws.table("edges")
+    neighbours = ws.table("neighbours")
+
+    # Create the edges table, adding self-loops.  Duplicate edges don't change
+    # the minimum over a node's neighbours, so they are kept rather than
+    # paying for a distinct over the whole edge list.
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {edges} AS
+    SELECT unique_id_l, unique_id_r
+    FROM {edges_without_self_loops}
+    WHERE unique_id_l <> unique_id_r
+    {_threshold_filter(threshold)}
+
+    UNION ALL
+
+    SELECT unique_id AS unique_id_l, unique_id AS unique_id_r
+    FROM {nodes}
+    """)
+
+    # Since the edges are undirected, we need to ensure both directions
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {neighbours} AS
+    SELECT unique_id_l AS node_id, unique_id_r AS neighbour
+    FROM {edges}
+    UNION ALL
+    SELECT unique_id_r AS node_id, unique_id_l AS neighbour
+    FROM {edges}
+    """)
+    return neighbours
+
+
+def _clusters_from_representatives(ws, representatives):
+    clusters = ws.table("clusters")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {clusters} AS
+    SELECT node_id AS unique_id, representative AS cluster_id
+    FROM {representatives}
+    """)
+    return clusters
+
+
+def _count_changed(ws, representatives, name="count changes"):
+    """Count the nodes flagged as changed by the step which wrote
+    `representatives`.  This scans a single column, rather than joining the
+    old and new representatives to compare them."""
+    return ws.execute(
+        f"SELECT COUNT(*) FROM {representatives} WHERE changed", name=name
+    ).fetchone()[0]
+
+
+def _breadth_first(ws, threshold):
+    # This algorithm is called Breadth First Search
+    # in the paper https://arxiv.org/pdf/1802.09478.pdf
+    neighbours = ws.table("neighbours")
+    representatives = ws.table("representatives")
+    updated_representatives = ws.table("updated_representatives")
+
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        _create_neighbours(ws, threshold)
+
+        # For each node, the initial representative is the minimum neighbour
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {representatives} AS
+        SELECT node_id, MIN(neighbour) AS representative
+        FROM {neighbours}
+        GROUP BY node_id
+        """)
+
+        state = {"iteration": 0, "changes": 1}  # To enter the loop
+        ws.checkpoint(**state)
+    iteration, changes = state["iteration"], state["changes"]
+
+    while changes > 0:
+        iteration += 1
+        ws.start_iteration()
+
+        # Update representatives by taking min of representatives of neighbours.
+        # Every node is its own neighbour, so its old representative is carried
+        # through the aggregation to flag whether it changed.
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {updated_representatives} AS
+        SELECT
+            n.node_id,
+            MIN(r2.representative) AS representative,
+            MIN(r2.representative) < MIN(r2.representative)
+                FILTER (WHERE n.neighbour = n.node_id) AS changed
+        FROM {neighbours} AS n
+        LEFT JOIN {representatives} AS r2
+        ON n.neighbour = r2.node_id
+        GROUP BY n.node_id
+        """)
+
+        ws.begin()
+        ws.replace(representatives, updated_representatives)
+        changes = _count_changed(ws, representatives)
+        logger.info(
+            f"Iteration {iteration}: Number of nodes with changed representative: {changes}"
+        )
+        ws.end_iteration(iteration, changes=changes)
+        ws.checkpoint(iteration=iteration, changes=changes)
+
+    return _clusters_from_representatives(ws, representatives)
+
+
+def _frontier(ws, threshold):
+    # Semi-naive breadth first search.  Representatives only ever decrease, so
+    # a node can only improve via a neighbour whose representative moved in
+    # the previous iteration.  Each iteration therefore aggregates just the
+    # neighbours of the `changed` frontier and merges the improvements back
+    # into representatives in place.
+    neighbours = ws.table("neighbours")
+    representatives = ws.table("representatives")
+    changed = ws.table("changed")
+    updated_changed = ws.table("updated_changed")
+
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        _create_neighbours(ws, threshold)
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {representatives} AS
+        SELECT node_id, MIN(neighbour) AS representative
+        FROM {neighbours}
+        GROUP BY node_id
+        """)
+
+        # Initially every node has changed
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {changed} AS
+        SELECT node_id, representative
+        FROM {representatives}
+        """)
+
+        state = {"iteration": 0, "changes": 1}  # To enter the loop
+        ws.checkpoint(**state)
+    iteration, changes = state["iteration"], state["changes"]
+
+    while changes > 0:
+        iteration += 1
+        ws.start_iteration()
+
+        # Nodes next to the frontier whose representative improves
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {updated_changed} AS
+        WITH delta AS (
+            SELECT n.node_id, MIN(c.representative) AS representative
+            FROM {changed} AS c
+            JOIN {neighbours} AS n
+            ON n.neighbour = c.node_id
+            GROUP BY n.node_id
+        )
+        SELECT d.node_id, d.representative
+        FROM delta AS d
+        JOIN {representatives} AS r
+        ON d.node_id = r.node_id
+        WHERE d.representative < r.representative
+        """)
+        ws.begin()
+        ws.replace(changed, updated_changed)
+
+        changes = ws.execute(
+            f"SELECT COUNT(*) FROM {changed}", name="count changes"
+        ).fetchone()[0]
+        logger.info(
+            f"Iteration {iteration}: Number of nodes with changed representative: {changes}"
+        )
+
+        if changes > 0:
+            ws.execute(f"""
+            UPDATE {representatives} AS r
+            SET representative = c.representative
+            FROM {changed} AS c
+            WHERE r.node_id = c.node_id
+            """)
+        ws.end_iteration(iteration, changes=changes)
+        ws.checkpoint(iteration=iteration, changes=changes)
+
+    return _clusters_from_representatives(ws, representatives)
+
+
+def _active(ws, threshold):
+    # Breadth first search, but only nodes with a neighbour which changed in
+    # the previous iteration (the active nodes) are recomputed.  The affected
+    # nodes are found once per iteration, and the changes are written into
+    # representatives in place, so inactive rows are never rewritten and the
+    # cost of an iteration falls with the number of active nodes.
+    neighbours = ws.table("neighbours")
+    representatives = ws.table("representatives")
+    changed = ws.table("changed")
+
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        _create_neighbours(ws, threshold)
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {representatives} AS
+        SELECT node_id, MIN(neighbour) AS representative, TRUE AS active
+        FROM {neighbours}
+        GROUP BY node_id
+        """)
+
+        state = {"iteration": 0, "changes": 1}  # To enter the loop
+        ws.checkpoint(**state)
+    iteration, changes = state["iteration"], state["changes"]
+
+    while changes > 0:
+        iteration += 1
+        ws.start_iteration()
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {changed} AS
+        WITH affected AS (
+            SELECT DISTINCT n.node_id
+            FROM {representatives} AS r
+            JOIN {neighbours} AS n ON n.neighbour = r.node_id
+            WHERE r.active
+        ),
+        updated AS (
+            SELECT n.node_id, MIN(r2.representative) AS representative
+            FROM affected AS a
+            JOIN {neighbours} AS n ON n.node_id = a.node_id
+            JOIN {representatives} AS r2 ON n.neighbour = r2.node_id
+            GROUP BY n.node_id
+        )
+        SELECT u.node_id, u.representative
+        FROM updated AS u
+        JOIN {representatives} AS r1 ON u.node_id = r1.node_id
+        WHERE u.representative <> r1.representative
+        """)
+
+        changes = ws.execute(
+            f"SELECT COUNT(*) FROM {changed}", name="count changes"
+        ).fetchone()[0]
+        logger.info(f"Iteration {iteration}: Number of active nodes: {changes}")
+
+        ws.begin()
+        # Only the previously active and the newly changed rows are written
+        ws.execute(f"""
+        UPDATE {representatives}
+        SET active = FALSE
+        WHERE active
+        """)
+        ws.execute(f"""
+        UPDATE {representatives} AS r
+        SET representative = c.representative, active = TRUE
+        FROM {changed} AS c
+        WHERE r.node_id = c.node_id
+        """)
+        ws.end_iteration(iteration, active=changes)
+        ws.checkpoint(iteration=iteration, changes=changes)
+
+    return _clusters_from_representatives(ws, representatives)
+
+
+def _path_compression(ws, threshold):
+    # Breadth first search, followed after each step by replacing every
+    # representative with the representative's representative
+    neighbours = ws.table("neighbours")
+    representatives = ws.table("representatives")
+    updated_representatives = ws.table("updated_representatives")
+    compressed_representatives = ws.table("compressed_representatives")
+
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        _create_neighbours(ws, threshold)
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {representatives} AS
+        SELECT node_id, MIN(neighbour) AS representative
+        FROM {neighbours}
+        GROUP BY node_id
+        """)
+
+        state = {"iteration": 0, "changes": 1}  # To enter the loop
+        ws.checkpoint(**state)
+    iteration, changes = state["iteration"], state["changes"]
+
+    while changes > 0:
+        iteration += 1
+        ws.start_iteration()
+
+        # The old representative is carried through, via each node's
+        # self-loop, to flag the nodes whose representative changed
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {updated_representatives} AS
+        SELECT
+            n.node_id,
+            MIN(r2.representative) AS representative,
+            MIN(r2.representative) FILTER (WHERE n.neighbour = n.node_id)
+                AS old_representative
+        FROM {neighbours} AS n
+        LEFT JOIN {representatives} AS r2
+        ON n.neighbour = r2.node_id
+        GROUP BY n.node_id
+        """)
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {compressed_representatives} AS
+        SELECT
+            u.node_id,
+            CASE
+                WHEN u.representative != u2.representative THEN u2.representative
+                ELSE u.representative
+            END AS representative,
+            LEAST(u.representative, u2.representative) < u.old_representative
+                AS changed
+        FROM {updated_representatives} u
+        LEFT JOIN {updated_representatives} u2 ON u.representative = u2.node_id
+        """)
+
+        ws.begin()
+        ws.replace(representatives, compressed_representatives)
+        changes = _count_changed(ws, representatives)
+        logger.info(
+            f"Iteration {iteration}: Number of nodes with changed representative: {changes}"
+        )
+        ws.end_iteration(iteration, changes=changes)
+        ws.checkpoint(iteration=iteration, changes=changes)
+
+    return _clusters_from_representatives(ws, representatives)
+
+
+def _shortcut(ws, representatives):
+    """Replace each representative with its representative until every tree
+    in the representatives forest is a star."""
+    shortcut_representatives = ws.table("shortcut_representatives")
+    changes = 1  # To enter the loop
+    while changes > 0:
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {shortcut_representatives} AS
+        SELECT
+            r.node_id,
+            p.representative,
+            p.representative < r.representative AS changed
+        FROM {representatives} AS r
+        JOIN {representatives} AS p
+        ON r.representative = p.node_id
+        """)
+
+        ws.replace(representatives, shortcut_representatives)
+        changes = _count_changed(ws, representatives, name="count shortcut changes")
+        logger.info(
+            f"Shortcutting: Number of nodes with changed representative: {changes}"
+        )
+
+
+def _pointer_jumping(ws, threshold):
+    # Hooking and shortcutting in the style of FastSV
+    # (https://arxiv.org/abs/1910.05971).  Representatives form a forest in
+    # which every node points at a node with a smaller or equal id.  Each
+    # iteration hooks every node, and every tree root, onto the smallest
+    # grandparent seen across its neighbours, then shortcuts until the forest
+    # is made of stars.  This needs O(log n) iterations on chains, and still
+    # labels each cluster with its minimum unique_id.
+    neighbours = ws.table("neighbours")
+    representatives = ws.table("representatives")
+    hooked_representatives = ws.table("hooked_representatives")
+
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        _create_neighbours(ws, threshold)
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {representatives} AS
+        SELECT node_id, MIN(neighbour) AS representative
+        FROM {neighbours}
+        GROUP BY node_id
+        """)
+
+        state = {"iteration": 0, "changes": 1}  # To enter the loop
+        ws.checkpoint(**state)
+    iteration, changes = state["iteration"], state["changes"]
+
+    while changes > 0:
+        iteration += 1
+        ws.start_iteration()
+
+        ws.begin()
+        _shortcut(ws, representatives)
+
+        # Hook each node onto the smallest grandparent among its neighbours,
+        # and each parent onto the smallest such value among its children
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {hooked_representatives} AS
+        WITH grandparents AS (
+            SELECT r.node_id, r.representative, p.representative AS grandparent
+            FROM {representatives} AS r
+            JOIN {representatives} AS p
+            ON r.representative = p.node_id
+        ),
+        neighbour_min AS (
+            SELECT n.node_id, MIN(g.grandparent) AS hook
+            FROM {neighbours} AS n
+            JOIN grandparents AS g
+            ON n.neighbour = g.node_id
+            GROUP BY n.node_id
+        ),
+        parent_hook AS (
+            SELECT g.representative AS node_id, MIN(m.hook) AS hook
+            FROM grandparents AS g
+            JOIN neighbour_min AS m
+            ON g.node_id = m.node_id
+            GROUP BY g.representative
+        ),
+        hooked AS (
+            SELECT
+                g.node_id,
+                g.representative AS old_representative,
+                LEAST(
+                    g.grandparent,
+                    m.hook,
+                    COALESCE(h.hook, g.grandparent)
+                ) AS representative
+            FROM grandparents AS g
+            JOIN neighbour_min AS m ON g.node_id = m.node_id
+            LEFT JOIN parent_hook AS h ON g.node_id = h.node_id
+        )
+        SELECT
+            node_id,
+            representative,
+            representative < old_representative AS changed
+        FROM hooked
+        """)
+
+        ws.replace(representatives, hooked_representatives)
+        changes = _count_changed(ws, representatives)
+        logger.info(
+            f"Iteration {iteration}: Number of nodes with changed representative: {changes}"
+        )
+        ws.end_iteration(iteration, changes=changes)
+        ws.checkpoint(iteration=iteration, changes=changes)
+
+    return _clusters_from_representatives(ws, representatives)
+
+
+def _union_find(pairs):
+    """In-memory union-find over (v, w) pairs.
+
+    Returns a dict mapping every node to the minimum node in its component.
+    """
+    parent = {}
+    for v, w in pairs:
+        parent.setdefault(v, v)
+        parent.setdefault(w, w)
+        in_memory.union(parent, v, w)
+
+    return {x: in_memory.find(parent, x) for x in parent}
+
+
+def _finish_in_memory(ws, E, R):
+    """Resolve the remaining edge table E in Python, writing representatives to R."""
+    roots = _union_find(ws.execute(f"SELECT v, w FROM {E}").fetchall())
+    representatives = {
+        "v": np.fromiter(roots.keys(), dtype=np.uint64, count=len(roots)),
+        "r": np.fromiter(roots.values(), dtype=np.uint64, count=len(roots)),
+    }
+    finished = ws.register("finished_in_memory", representatives)
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {R} AS
+    SELECT v::UBIGINT AS v, r::UBIGINT AS r
+    FROM {finished}
+    """)
+
+
+def _compose_single_pass(ws, S, k):
+    """Resolve the chain R1..Rk into R1 with a single query.
+
+    Each node follows its representative through as many levels as it
+    appears in, and labels which stop at level j are carried into the hash
+    space of level k by the composition of the remaining hash functions.
+    These compositions are computed in Python rather than with one round
+    trip per level.
+    """
+    R = [ws.table(f"R{j}") for j in range(1, k + 1)]
+
+    # F[j] maps a label from level j's hash space to level k's
+    F = [None] * k
+    A, B = 1, 0
+    F[k - 1] = (A, B)
+    for j in range(k - 1, 0, -1):
+        alpha, beta = S[j]
+        A, B = (A * alpha) % 2**32, (A * beta + B) % 2**32
+        F[j - 1] = (A, B)
+
+    joins = "\n".join(
+        f"LEFT JOIN {R[j]} AS L{j + 1} ON L{j}.r = L{j + 1}.v" for j in range(1, k)
+    )
+    labels = ", ".join(
+        [f"L{k}.r"]
+        + [
+            f"({F[j - 1][0]}::ubigint * L{j}.r + {F[j - 1][1]}::ubigint) % 4294967296::ubigint"
+            for j in range(k - 1, 0, -1)
+        ]
+    )
+    T = ws.table("T")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {T} AS
+    SELECT L1.v, COALESCE({labels}) AS r
+    FROM {R[0]} AS L1
+    {joins}
+    """)
+    logger.info(f"Composed {k} levels of representatives in a single pass")
+
+    for R_j in R[1:]:
+        ws.execute(f"DROP TABLE {R_j}")
+    ws.replace(R[0], T)
+
+
+def _randomised_contraction(
+    ws, threshold, seed=None, finish_below=None, compose="chain"
+):
+    # Randomized contraction from https://arxiv.org/pdf/1802.09478.pdf
+    # Expects integer unique_ids below 2**32, which axb hashes bijectively.
+    # cluster() remaps other unique_ids to dense keys first.
+    #
+    # If finish_below is set, once fewer than that many edges remain they are
+    # pulled into Python and finished with an in-memory union-find, to avoid
+    # paying per-statement overhead for the last, tiny iterations
+    #
+    # compose="single_pass" resolves the chain of representative tables in
+    # one query, rather than one join per level working backwards
+    if compose not in ("chain", "single_pass"):
+        raise ValueError(
+            f"Unknown compose {compose!r}, expected 'chain' or 'single_pass'"
+        )
+    rng = random.Random(seed)
+    nodes = ws.table("nodes")
+    edges_without_self_loops = ws.table("edges_without_self_loops")
+    E = ws.table("E")
+    T = ws.table("T")
+    axb = ws.table("axb")
+    clusters = ws.table("clusters")
+
+    # 2**32 is a DOUBLE in DuckDB, so the modulus is written out as an integer
+    # to keep the hash exact
+    ws.execute(f"""
+    CREATE OR REPLACE TEMP MACRO {axb}(a, x, b) AS (
+        (cast(a as ubigint) * cast(x as ubigint) + cast(b as ubigint)) % 4294967296::ubigint
+    )
+    """)
+
+    # A resumed run carries on with the same hash functions and random stream
+    state = ws.saved_state()
+    if state is None:
+        ws.begin()
+        # Create the edges table E, in both directions
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {E} AS
+        SELECT unique_id_l AS v, unique_id_r AS w
+        FROM {edges_without_self_loops}
+        WHERE unique_id_l <> unique_id_r
+        {_threshold_filter(threshold)}
+        UNION ALL
+        SELECT unique_id_r AS v, unique_id_l AS w
+        FROM {edges_without_self_loops}
+        WHERE unique_id_l <> unique_id_r
+        {_threshold_filter(threshold)}
+        """)
+        state = {
+            "iteration": 0,
+            "remaining_edges": 1,  # To enter the loop
+            "S": [],
+            "rng": rng.getstate(),
+            "composed": False,
+        }
+        ws.checkpoint(**state)
+    else:
+        version, internal_state, gauss_next = state["rng"]
+        rng.setstate((version, tuple(internal_state), gauss_next))
+
+    S = [tuple(parameters) for parameters in state["S"]]
+    i = state["iteration"]
+    rowcount = state["remaining_edges"]
+
+    while rowcount > 0:
+        i += 1
+        ws.start_iteration()
+        # A must be odd for axb to be a bijection on 32 bit integers
+        A = rng.randrange(1, 2**32, 2)
+        B = rng.randint(0, 2**32 - 1)
+        S.append((A, B))
+        R_i = ws.table(f"R{i}")
+
+        # Compute representatives
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {R_i} AS
+        SELECT v, LEAST({axb}({A}::ubigint, v, {B}::ubigint), MIN({axb}({A}::ubigint, w, {B}::ubigint))) AS r
+        FROM {E}
+        GROUP BY v
+        """)
+
+        # Contract by transforming edge table
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {T} AS
+        SELECT DISTINCT V.r AS v, W.r AS w
+        FROM {E} AS E, {R_i} AS V, {R_i} AS W
+        WHERE E.v = V.v AND E.w = W.v AND V.r != W.r
+        """)
+
+        rowcount = ws.execute(
+            f"SELECT COUNT(*) FROM {T}", name="count edges"
+        ).fetchone()[0]
+        logger.info(f"Iteration {i}: Number of edges remaining: {rowcount}")
+
+        ws.begin()
+        ws.replace(E, T)
+        ws.end_iteration(i, remaining_edges=rowcount)
+
+        if finish_below is not None and 0 < rowcount < finish_below:
+            i += 1
+            # The final level keeps the previous level's labels, i.e. its
+            # hash function is the identity
+            S.append((1, 0))
+            logger.info(f"Iteration {i}: Finishing {rowcount} edges in memory")
+            ws.start_iteration()
+            _finish_in_memory(ws, E, ws.table(f"R{i}"))
+            rowcount = 0
+            ws.end_iteration(i, remaining_edges=rowcount)
+
+        ws.checkpoint(
+            iteration=i,
+            remaining_edges=rowcount,
+            S=S,
+            rng=rng.getstate(),
+            composed=False,
+        )
+
+    # Compose representative functions.  This runs in one transaction, so an
+    # interrupted composition is redone from the start when resumed.
+    if not state["composed"]:
+        ws.begin()
+        if compose == "single_pass":
+            _compose_single_pass(ws, S, i)
+        else:
+            A, B = 1, 0
+            while i > 1:
+                i -= 1
+                alpha, beta = S.pop()
+                A, B = ws.execute(
+                    f"SELECT {axb}({A}::ubigint, {alpha}::ubigint, 0), {axb}({A}::ubigint, {beta}::ubigint, {B}::ubigint)"
+                ).fetchone()
+                R_i = ws.table(f"R{i}")
+                R_next = ws.table(f"R{i + 1}")
+
+                ws.execute(f"""
+                CREATE OR REPLACE TABLE {T} AS
+                SELECT L.v, COALESCE(R.r, {axb}({A}::ubigint, L.r, {B}::ubigint)) AS r
+                FROM {R_i} AS L
+                LEFT OUTER JOIN {R_next} AS R ON (L.r = R.v)
+                """)
+                logger.info(f"Iteration {i}: Composing representatives")
+
+                ws.execute(f"DROP TABLE {R_next}")
+                ws.replace(R_i, T)
+        ws.checkpoint(
+            iteration=i, remaining_edges=0, S=[], rng=rng.getstate(), composed=True
+        )
+
+    # The composed labels are hash values, so relabel each cluster with its
+    # minimum unique_id.  Nodes with no edges are not in R1 and are singletons.
+    R_1 = ws.table("R1")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {clusters} AS
+    WITH labels AS (
+        SELECT n.unique_id, R.r
+        FROM {nodes} AS n
+        LEFT JOIN {R_1} AS R ON n.unique_id = R.v
+    )
+    SELECT
+        unique_id,
+        CASE
+            WHEN r IS NULL THEN unique_id
+            ELSE MIN(unique_id) OVER (PARTITION BY r)
+        END AS cluster_id
+    FROM labels
+    """)
+    return clusters
+
+
+def _in_memory(ws, threshold, use_scipy=None):
+    # Pull the graph into NumPy arrays and solve it in process, see in_memory.py
+    nodes = ws.table("nodes")
+    edges_without_self_loops = ws.table("edges_without_self_loops")
+
+    node_ids = ws.execute(f"SELECT unique_id FROM {nodes}").fetchnumpy()["unique_id"]
+    edges = ws.execute(f"""
+    SELECT unique_id_l, unique_id_r
+    FROM {edges_without_self_loops}
+    WHERE unique_id_l <> unique_id_r
+    {_threshold_filter(threshold)}
+    """).fetchnumpy()
+
+    node_ids, cluster_ids = in_memory.component_labels(
+        node_ids, edges["unique_id_l"], edges["unique_id_r"], use_scipy=use_scipy
+    )
+    return ws.register("clusters", {"unique_id": node_ids, "cluster_id": cluster_ids})
+
+
+def _reduce(ws, nodes, edges, threshold):
+    """Resolve the trivial parts of the graph before the iterative algorithm.
+
+    Nodes without edges are singletons, and two nodes whose only edge joins
+    them are a pair; both are labelled here directly.  Leaves, nodes of
+    degree 1 joined to a node of higher degree, are set aside and take the
+    cluster of their neighbour in `_expand_reduced`.
+
+    Returns the core nodes and edges which are left to cluster, already
+    filtered by `threshold`.
+    """
+    filtered_edges = ws.table("filtered_edges")
+    degree_one = ws.table("degree_one")
+    core_nodes = ws.table("core_nodes")
+    core_edges = ws.table("core_edges")
+    reduced_clusters = ws.table("reduced_clusters")
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {filtered_edges} AS
+    SELECT unique_id_l, unique_id_r
+    FROM {edges}
+    WHERE unique_id_l <> unique_id_r
+    {_threshold_filter(threshold)}
+    """)
+
+    # A node has a single distinct neighbour if its smallest and largest
+    # neighbours are the same, which needs no distinct over the edges
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {ws.table("degrees")} AS
+    WITH ends AS (
+        SELECT unique_id_l AS node_id, unique_id_r AS neighbour
+        FROM {filtered_edges}
+        UNION ALL
+        SELECT unique_id_r AS node_id, unique_id_l AS neighbour
+        FROM {filtered_edges}
+    )
+    SELECT
+        node_id,
+        MIN(neighbour) AS neighbour,
+        MIN(neighbour) = MAX(neighbour) AS degree_one
+    FROM ends
+    GROUP BY node_id
+    """)
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {degree_one} AS
+    SELECT d.node_id, d.neighbour, n.degree_one AS in_pair
+    FROM {ws.table("degrees")} AS d
+    JOIN {ws.table("degrees")} AS n ON d.neighbour = n.node_id
+    WHERE d.degree_one
+    """)
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {core_nodes} AS
+    SELECT node_id AS unique_id
+    FROM {ws.table("degrees")}
+    WHERE NOT degree_one
+    """)
+    # Every edge of a degree 1 node is its only edge, so the core edges are
+    # those with neither end of degree 1
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {core_edges} AS
+    SELECT e.unique_id_l, e.unique_id_r
+    FROM {filtered_edges} AS e
+    ANTI JOIN {degree_one} AS l ON e.unique_id_l = l.node_id
+    ANTI JOIN {degree_one} AS r ON e.unique_id_r = r.node_id
+    """)
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {reduced_clusters} AS
+    SELECT n.unique_id, n.unique_id AS cluster_id
+    FROM {nodes} AS n
+    ANTI JOIN {ws.table("degrees")} AS d ON n.unique_id = d.node_id
+    UNION ALL
+    SELECT node_id AS unique_id, LEAST(node_id, neighbour) AS cluster_id
+    FROM {degree_one}
+    WHERE in_pair
+    """)
+
+    singletons_and_pairs, leaves, core = ws.execute(f"""
+    SELECT
+        (SELECT COUNT(*) FROM {reduced_clusters}),
+        (SELECT COUNT(*) FROM {degree_one} WHERE NOT in_pair),
+        (SELECT COUNT(*) FROM {core_nodes})
+    """).fetchone()
+    logger.info(
+        f"Reduction: {singletons_and_pairs} nodes in singletons and pairs, "
+        f"{leaves} leaves, {core} nodes left to cluster"
+    )
+
+    ws.execute(f"DROP TABLE {filtered_edges}")
+    ws.execute(f"DROP TABLE {ws.table('degrees')}")
+    return core_nodes, core_edges
+
+
+def _expand_reduced(ws, core_clusters):
+    """Combine the clusters of the core with the nodes set aside by `_reduce`.
+
+    A cluster's minimum unique_id may be one of its leaves, so the cluster
+    ids of clusters with leaves are recomputed.
+    """
+    degree_one = ws.table("degree_one")
+    clusters = ws.table("expanded_clusters")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {clusters} AS
+    WITH with_leaves AS (
+        SELECT unique_id, cluster_id
+        FROM {core_clusters}
+        UNION ALL
+        SELECT l.node_id AS unique_id, c.cluster_id
+        FROM {degree_one} AS l
+        JOIN {core_clusters} AS c ON l.neighbour = c.unique_id
+        WHERE NOT l.in_pair
+    )
+    SELECT unique_id, MIN(unique_id) OVER (PARTITION BY cluster_id) AS cluster_id
+    FROM with_leaves
+    UNION ALL
+    SELECT unique_id, cluster_id
+    FROM {ws.table("reduced_clusters")}
+    """)
+    return clusters
+
+
+_INTEGER_TYPES = {
+    "TINYINT",
+    "SMALLINT",
+    "INTEGER",
+    "BIGINT",
+    "HUGEINT",
+    "UTINYINT",
+    "USMALLINT",
+    "UINTEGER",
+    "UBIGINT",
+    "UHUGEINT",
+}
+
+
+def _needs_remap(ws, nodes):
+    """Whether `nodes` has unique_ids which aren't integers in [0, 2**32)."""
+    (column_type,) = ws.execute(f"""
+    SELECT column_type
+    FROM (DESCRIBE SELECT unique_id FROM {nodes})
+    """).fetchone()
+    if column_type not in _INTEGER_TYPES:
+        return True
+    smallest, largest = ws.execute(
+        f"SELECT MIN(unique_id), MAX(unique_id) FROM {nodes}"
+    ).fetchone()
+    return smallest is not None and (smallest < 0 or largest >= 2**32)
+
+
+def _remap_ids(ws, nodes, edges):
+    """Replace unique_ids of any type with dense UINTEGER surrogate keys.
+
+    Keys are numbered in unique_id order, so the minimum key in a cluster is
+    the key of its minimum unique_id.  Returns the id map and the remapped
+    nodes and edges.
+    """
+    id_map = ws.table("id_map")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {id_map} AS
+    SELECT
+        unique_id,
+        (ROW_NUMBER() OVER (ORDER BY unique_id) - 1)::UINTEGER AS id
+    FROM {nodes}
+    """)
+    remapped_nodes = ws.table("remapped_nodes")
+    remapped_edges = ws.table("remapped_edges")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {remapped_nodes} AS
+    SELECT id AS unique_id
+    FROM {id_map}
+    """)
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {remapped_edges} AS
+    SELECT e.* REPLACE (l.id AS unique_id_l, r.id AS unique_id_r)
+    FROM {edges} AS e
+    JOIN {id_map} AS l ON e.unique_id_l = l.unique_id
+    JOIN {id_map} AS r ON e.unique_id_r = r.unique_id
+    """)
+    return id_map, remapped_nodes, remapped_edges
+
+
+def _restore_ids(ws, clusters, id_map):
+    restored = ws.table("restored_clusters")
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {restored} AS
+    SELECT n.unique_id, c.unique_id AS cluster_id
+    FROM {clusters} AS k
+    JOIN {id_map} AS n ON k.unique_id = n.id
+    JOIN {id_map} AS c ON k.cluster_id = c.id
+    """)
+    return restored
+
+
+_ALGORITHMS = {
+    "breadth_first": _breadth_first,
+    "frontier": _frontier,
+    "active": _active,
+    "path_compression": _path_compression,
+    "pointer_jumping": _pointer_jumping,
+    "randomised_contraction": _randomised_contraction,
+    "in_memory": _in_memory,
+}
+
+ALGORITHMS = tuple(_ALGORITHMS)
+
+
+def _check_algorithm(algorithm):
+    if algorithm not in _ALGORITHMS:
+        raise ValueError(
+            f"Unknown algorithm {algorithm!r}, expected one of {', '.join(ALGORITHMS)}"
+        )
+
+
+def _cluster_in_workspace(
+    ws,
+    nodes,
+    edges,
+    threshold,
+    algorithm,
+    remap_ids=None,
+    reduce_graph=False,
+    options=None,
+):
+    """Run `algorithm` in `ws`, returning the name of its clusters table."""
+    state = ws.saved_state()
+    if state is not None and state["algorithm"] != algorithm:
+        raise ValueError(
+            f"Can't resume a {state['algorithm']} run with algorithm {algorithm!r}"
+        )
+    ws.algorithm = algorithm
+    nodes = ws.register("input_nodes", nodes)
+    edges = ws.register("input_edges", edges)
+    if remap_ids is None:
+        remap_ids = algorithm == "randomised_contraction" and _needs_remap(ws, nodes)
+    if remap_ids:
+        id_map, nodes, edges = _remap_ids(ws, nodes, edges)
+    if reduce_graph:
+        nodes, edges = _reduce(ws, nodes, edges, threshold)
+        threshold = None
+    ws.register("nodes", nodes)
+    ws.register("edges_without_self_loops", edges)
+
+    clusters = _ALGORITHMS[algorithm](ws, threshold, **(options or {}))
+    if reduce_graph:
+        clusters = _expand_reduced(ws, clusters)
+    if remap_ids:
+        clusters = _restore_ids(ws, clusters, id_map)
+    return clusters
+
+
+def _merge_clusters(
+    ws,
+    clusters,
+    edges,
+    algorithm="breadth_first",
+    metrics=None,
+    remap_ids=None,
+    reduce_graph=False,
+    options=None,
+):
+    """Find the clusters which `edges` join together.
+
+    `clusters` has `unique_id, cluster_id` columns, where each cluster_id is
+    the minimum unique_id in its cluster, and `edges` `unique_id_l,
+    unique_id_r` columns.  The edges are mapped onto the clusters at their
+    ends, and only this graph of clusters is clustered, with `algorithm` and
+    the other arguments as for `cluster`.  Since cluster ids are minimum
+    unique_ids, the smallest cluster_id in each group of joined clusters is
+    the minimum unique_id of the merged cluster.
+
+    Returns the name of a `merged` table of `old_cluster_id, cluster_id`, with
+    a row for each cluster which merges into one with a smaller id, and the
+    number of edges between clusters.
+    """
+    cluster_edges = ws.table("cluster_edges")
+    cluster_nodes = ws.table("cluster_nodes")
+    merged = ws.table("merged")
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {cluster_edges} AS
+    SELECT DISTINCT l.cluster_id AS unique_id_l, r.cluster_id AS unique_id_r
+    FROM {edges} AS e
+    JOIN {clusters} AS l ON e.unique_id_l = l.unique_id
+    JOIN {clusters} AS r ON e.unique_id_r = r.unique_id
+    WHERE l.cluster_id <> r.cluster_id
+    """)
+    num_edges = ws.execute(f"SELECT COUNT(*) FROM {cluster_edges}").fetchone()[0]
+    if num_edges == 0:
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {merged} AS
+        SELECT cluster_id AS old_cluster_id, cluster_id
+        FROM {clusters}
+        LIMIT 0
+        """)
+        return merged, num_edges
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {cluster_nodes} AS
+    SELECT unique_id_l AS unique_id FROM {cluster_edges}
+    UNION
+    SELECT unique_id_r AS unique_id FROM {cluster_edges}
+    """)
+
+    cluster_ws = _Workspace(ws.con, metrics=metrics)
+    try:
+        merged_clusters = _cluster_in_workspace(
+            cluster_ws,
+            cluster_nodes,
+            cluster_edges,
+            None,
+            algorithm,
+            remap_ids,
+            reduce_graph,
+            options,
+        )
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {merged} AS
+        SELECT unique_id AS old_cluster_id, cluster_id
+        FROM {merged_clusters}
+        WHERE unique_id <> cluster_id
+        """)
+    finally:
+        cluster_ws.cleanup()
+    return merged, num_edges
+
+
+def cluster(
+    nodes,
+    edges,
+    threshold=None,
+    algorithm="breadth_first",
+    con=None,
+    metrics=None,
+    profile=False,
+    on_iteration=None,
+    remap_ids=None,
+    reduce_graph=False,
+    run_id=None,
+    output=None,
+    **options,
+):
+    """Cluster `nodes` into connected components using `edges`.
+
+    `nodes` must have a `unique_id` column, and `edges` `unique_id_l` and
+    `unique_id_r` columns, plus `match_probability` if a `threshold` is given.
+    Either can be a DataFrame, an Arrow table, a DuckDB relation or the name
+    of a table on `con`, or the path of a Parquet file, e.g.
+    "edges/*.parquet", which is read in place.  Any further keyword
+    `options` are passed to the chosen algorithm.
+
+    If `metrics` is a list, a dict is appended to it for each iteration, with
+    the iteration number, the number of changed (or active) nodes or the
+    remaining edges, and the time taken.  Its `statements` are a list of
+    dicts with the name and time taken of each SQL statement in the
+    iteration.  If `profile` is set, DuckDB's profiler is used to add the
+    rows scanned by the iteration and by each statement, and each
+    statement's `operator_timing`, the seconds spent in each operator.
+    `on_iteration`, if given, is called with each of these dicts as soon as
+    its iteration finishes.
+
+    With `remap_ids`, unique_ids are mapped to dense UINTEGER keys before
+    clustering and back afterwards, so the joins and aggregations work on 4
+    byte keys, and unique_ids can be strings or sparse 64 bit integers.  By
+    default this is done only if the algorithm is randomised_contraction and
+    the unique_ids aren't already integers in [0, 2**32).
+
+    With `reduce_graph`, nodes without edges and isolated pairs are labelled
+    directly, and leaves are attached to their neighbour's cluster at the
+    end, so only the remaining core of the graph goes through the algorithm.
+
+    With a `run_id`, the working tables are named after it, and each
+    iteration is committed along with the state needed to resume after it,
+    including randomised_contraction's hash parameters.  If `con` is a
+    file-backed database, a run which fails or is killed keeps its tables,
+    and calling `cluster` again with the same inputs and `run_id` resumes it
+    from the last completed iteration.  The tables are dropped once the run
+    completes.
+
+    Returns a DataFrame of `unique_id, cluster_id`, where the cluster_id is the
+    minimum unique_id in the cluster, ordered by cluster_id and unique_id.
+    With an `output` path, the result is instead written to that Parquet
+    file by DuckDB, without passing through pandas, and the path returned.
+    """
+    _check_algorithm(algorithm)
+    if con is None:
+        con = duckdb.connect()
+
+    ws = _Workspace(
+        con,
+        metrics=metrics,
+        profile=profile,
+        on_iteration=on_iteration,
+        run_id=run_id,
+    )
+    try:
+        clusters = _cluster_in_workspace(
+            ws, nodes, edges, threshold, algorithm, remap_ids, reduce_graph, options
+        )
+        result = _fetch(
+            ws,
+            f"""
+            SELECT unique_id, cluster_id
+            FROM {clusters}
+            ORDER BY cluster_id, unique_id
+            """,
+            output,
+        )
+    except BaseException:
+        # Keep the tables of a resumable run, as of its last checkpoint
+        if ws.resumable:
+            ws.rollback()
+        else:
+            ws.cleanup()
+        raise
+    ws.cleanup()
+    return result
+
+
+def _cluster_batches(
+    nodes,
+    edges,
+    threshold,
+    algorithm,
+    con,
+    batch_size,
+    ordered,
+    metrics,
+    profile,
+    on_iteration,
+    remap_ids,
+    reduce_graph,
+    options,
+):
+    """The generator behind `cluster_batches`, which checks its arguments
+    before the first batch is asked for."""
+    ws = _Workspace(con, metrics=metrics, profile=profile, on_iteration=on_iteration)
+    try:
+        clusters = _cluster_in_workspace(
+            ws, nodes, edges, threshold, algorithm, remap_ids, reduce_graph, options
+        )
+        order_by = "ORDER BY cluster_id, unique_id" if ordered else ""
+        reader = ws.execute(f"""
+        SELECT unique_id, cluster_id
+        FROM {clusters}
+        {order_by}
+        """).fetch_record_batch(batch_size)
+        yield from reader
+    finally:
+        ws.cleanup()
+
+
+def cluster_batches(
+    nodes,
+    edges,
+    threshold=None,
+    algorithm="breadth_first",
+    con=None,
+    batch_size=1_000_000,
+    ordered=False,
+    metrics=None,
+    profile=False,
+    on_iteration=None,
+    remap_ids=None,
+    reduce_graph=False,
+    **options,
+):
+    """Cluster as `cluster` does, yielding the result in Arrow record batches.
+
+    Each batch has `unique_id, cluster_id` columns and at most `batch_size`
+    rows, and batches are fetched from DuckDB as they are consumed, so the
+    whole result is never held in Python at once.  The rows come in no
+    particular order, which avoids a full sort; pass `ordered` to order them
+    by cluster_id and unique_id.  Requires pyarrow.
+
+    The clustering itself runs when the first batch is asked for, but the
+    `algorithm` and `batch_size` are checked straight away.  `con` must not
+    be used for other queries until the batches are exhausted, as that would
+    close the result they are fetched from.  The working tables are dropped
+    once the generator finishes or is closed.
+    """
+    _check_algorithm(algorithm)
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1, got {batch_size}")
+    if con is None:
+        con = duckdb.connect()
+
+    return _cluster_batches(
+        nodes,
+        edges,
+        threshold,
+        algorithm,
+        con,
+        batch_size,
+        ordered,
+        metrics,
+        profile,
+        on_iteration,
+        remap_ids,
+        reduce_graph,
+        options,
+    )
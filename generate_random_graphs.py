@@ -1,8 +1,13 @@
+import os
 import random
 
+import duckdb
 import networkx as nx
+import numpy as np
 import pandas as pd
 
+import connected_components as cc
+
 
 def generate_graph(graph_size=1000, master_seed=42):
     random.seed(master_seed)
@@ -16,8 +21,7 @@ def generate_graph(graph_size=1000, master_seed=42):
         return pd.DataFrame({"unique_id": range(num_rows)})
 
     def generate_random_edges(G):
-        edges = [{"unique_id_l": u, "unique_id_r": v} for u, v in G.edges()]
-        return pd.DataFrame(edges)
+        return pd.DataFrame(list(G.edges()), columns=["unique_id_l", "unique_id_r"])
 
     G = generate_random_graph(graph_size)
     nodes = generate_random_nodes(G.number_of_nodes())
@@ -36,8 +40,7 @@ def generate_chain_graph(graph_size=1000, master_seed=42):
         return pd.DataFrame({"unique_id": range(num_rows)})
 
     def generate_chain_edges(G):
-        edges = [{"unique_id_l": u, "unique_id_r": v} for u, v in G.edges()]
-        return pd.DataFrame(edges)
+        return pd.DataFrame(list(G.edges()), columns=["unique_id_l", "unique_id_r"])
 
     G = generate_chain_networkx_graph(graph_size)
     nodes = generate_random_nodes(G.number_of_nodes())
@@ -72,3 +75,189 @@ def generate_uniform_probability_graph(graph_size=1000, num_edges=2000, master_s
     edges = generate_random_edges(graph_size, num_edges)
 
     return nodes, edges
+
+
+# Vectorised generators for large benchmark inputs.
+#
+# The generators above build Python objects per edge, which is much slower
+# than clustering the result at millions of edges.  generate_edge_chunks
+# instead draws edges with NumPy, a chunk at a time, so graphs can be
+# streamed into DuckDB or Parquet without ever being held in memory whole.
+#
+# Every shape except "uniform" is a set of clusters.  The nodes of each
+# cluster are joined in a path, so the cluster is connected, and the rest of
+# the edges join random pairs of nodes within the clusters' dense parts.
+# Node ids are shuffled so clusters aren't runs of consecutive ids.
+
+SHAPES = ("uniform", "power_law", "giant_component", "chain_blobs")
+
+# Beta distribution parameters for match_probability, None for uniform
+PROBABILITY_DISTRIBUTIONS = {
+    "uniform": None,
+    "skewed_high": (5, 1),
+    "skewed_low": (1, 5),
+    "bimodal": (0.3, 0.3),
+}
+
+
+def _power_law_sizes(rng, num_nodes, exponent=2.0, max_cluster_size=1000):
+    if num_nodes <= 0:
+        return np.zeros(0, dtype=np.int64)
+    sizes = []
+    total = 0
+    while total < num_nodes:
+        batch = np.minimum(rng.zipf(exponent, size=max(num_nodes // 2, 1)), max_cluster_size)
+        sizes.append(batch)
+        total += batch.sum()
+    sizes = np.concatenate(sizes)
+    sizes = sizes[: np.searchsorted(np.cumsum(sizes), num_nodes) + 1]
+    sizes[-1] -= sizes.sum() - num_nodes
+    return sizes
+
+
+def _cluster_layout(rng, shape, num_nodes, giant_fraction, chain_length, blob_size):
+    """Return the size of each cluster and of its dense part."""
+    if shape == "power_law":
+        sizes = _power_law_sizes(rng, num_nodes)
+        return sizes, sizes
+    if shape == "giant_component":
+        giant = int(num_nodes * giant_fraction)
+        sizes = np.concatenate([[giant], _power_law_sizes(rng, num_nodes - giant)])
+        sizes = sizes[sizes > 0]
+        return sizes, sizes
+    if shape == "chain_blobs":
+        cluster_size = chain_length + blob_size
+        sizes = np.full(num_nodes // cluster_size, cluster_size)
+        if num_nodes % cluster_size:
+            sizes = np.append(sizes, num_nodes % cluster_size)
+        return sizes, np.minimum(sizes, blob_size)
+    raise ValueError(f"Unknown shape {shape!r}, expected one of {', '.join(SHAPES)}")
+
+
+def _match_probabilities(rng, n, probability_distribution):
+    parameters = PROBABILITY_DISTRIBUTIONS[probability_distribution]
+    if parameters is None:
+        return rng.random(n)
+    return rng.beta(*parameters, size=n)
+
+
+def generate_edge_chunks(
+    shape="power_law",
+    num_nodes=1000,
+    num_edges=2000,
+    chunk_size=1_000_000,
+    probability_distribution="uniform",
+    master_seed=42,
+    giant_fraction=0.3,
+    chain_length=1000,
+    blob_size=50,
+):
+    """Yield DataFrames of at most `chunk_size` edges of a random graph.
+
+    The nodes are the integers up to `num_nodes`.  Each edge has a
+    match_probability drawn from `probability_distribution`, one of
+    PROBABILITY_DISTRIBUTIONS.  `shape` is one of SHAPES:
+
+    - "uniform": edges between uniformly random pairs of nodes
+    - "power_law": clusters whose sizes follow a power law
+    - "giant_component": one cluster with `giant_fraction` of the nodes, and
+      power law clusters for the rest
+    - "chain_blobs": clusters made of a chain of `chain_length` nodes
+      attached to a dense blob of `blob_size` nodes
+
+    Cluster shapes always include the edges needed to connect each cluster,
+    so may have more than `num_edges` edges.  Self-loops are dropped, so any
+    shape may have slightly fewer.
+    """
+    rng = np.random.default_rng(master_seed)
+
+    def edge_frame(left, right):
+        keep = left != right
+        left, right = left[keep], right[keep]
+        return pd.DataFrame(
+            {
+                "unique_id_l": left,
+                "unique_id_r": right,
+                "match_probability": _match_probabilities(
+                    rng, len(left), probability_distribution
+                ),
+            }
+        )
+
+    if shape == "uniform":
+        for start in range(0, num_edges, chunk_size):
+            n = min(chunk_size, num_edges - start)
+            yield edge_frame(
+                rng.integers(0, num_nodes, size=n), rng.integers(0, num_nodes, size=n)
+            )
+        return
+
+    sizes, dense_sizes = _cluster_layout(
+        rng, shape, num_nodes, giant_fraction, chain_length, blob_size
+    )
+    starts = np.cumsum(sizes) - sizes
+    ids = rng.permutation(num_nodes)
+
+    # Paths through each cluster, joining each position to the next unless
+    # the next starts a new cluster
+    is_start = np.zeros(num_nodes + 1, dtype=bool)
+    is_start[starts] = True
+    is_start[num_nodes] = True
+    for start in range(0, num_nodes - 1, chunk_size):
+        positions = np.arange(start, min(start + chunk_size, num_nodes - 1))
+        positions = positions[~is_start[positions + 1]]
+        yield edge_frame(ids[positions], ids[positions + 1])
+
+    # Random pairs within the dense part of a cluster, if there are any nodes
+    dense_ends = np.cumsum(dense_sizes)
+    extra_edges = max(num_edges - (num_nodes - len(sizes)), 0) if num_nodes else 0
+    for start in range(0, extra_edges, chunk_size):
+        n = min(chunk_size, extra_edges - start)
+        k = rng.integers(0, dense_ends[-1], size=n)
+        cluster = np.searchsorted(dense_ends, k, side="right")
+        left = starts[cluster] + k - (dense_ends[cluster] - dense_sizes[cluster])
+        right = starts[cluster] + rng.integers(0, dense_sizes[cluster])
+        yield edge_frame(ids[left], ids[right])
+
+
+def write_graph_to_duckdb(con, nodes_table="nodes", edges_table="edges", num_nodes=1000, **kwargs):
+    """Stream a generated graph into tables on DuckDB connection `con`.
+
+    Further keyword arguments are passed to `generate_edge_chunks`.
+    """
+    con.execute(f"""
+    CREATE OR REPLACE TABLE {nodes_table} AS
+    SELECT range AS unique_id FROM range({num_nodes})
+    """)
+    con.execute(f"""
+    CREATE OR REPLACE TABLE {edges_table} (
+        unique_id_l BIGINT, unique_id_r BIGINT, match_probability DOUBLE
+    )
+    """)
+    for chunk in generate_edge_chunks(num_nodes=num_nodes, **kwargs):
+        con.register("__edge_chunk", chunk)
+        con.execute(f"INSERT INTO {edges_table} SELECT * FROM __edge_chunk")
+        con.unregister("__edge_chunk")
+
+
+def write_graph_to_parquet(path, num_nodes=1000, **kwargs):
+    """Stream a generated graph to Parquet files under directory `path`.
+
+    Writes `nodes.parquet`, and a file per chunk of edges under `edges/`, so
+    the edges can be read with `read_parquet('<path>/edges/*.parquet')`.
+    Further keyword arguments are passed to `generate_edge_chunks`.
+    """
+    os.makedirs(os.path.join(path, "edges"), exist_ok=True)
+    con = duckdb.connect()
+    con.execute(f"""
+    COPY (SELECT range AS unique_id FROM range({num_nodes}))
+    TO {cc._quote(os.path.join(path, "nodes.parquet"))} (FORMAT PARQUET)
+    """)
+    for i, chunk in enumerate(generate_edge_chunks(num_nodes=num_nodes, **kwargs)):
+        con.register("edge_chunk", chunk)
+        con.execute(f"""
+        COPY edge_chunk
+        TO {cc._quote(os.path.join(path, "edges", f"part-{i:05d}.parquet"))}
+        (FORMAT PARQUET)
+        """)
+        con.unregister("edge_chunk")
@@ -2,47 +2,17 @@ import random
 import time
 
 import duckdb
-import networkx as nx
-import pandas as pd
 
 import generate_random_graphs as gen
+import validation
 
 
-def validate_with_networkx(nodes, edges_without_self_loops, probability_threshold):
-    G = nx.Graph()
-    G.add_nodes_from(nodes["unique_id"])
-
-    for _, edge in edges_without_self_loops.iterrows():
-        if edge["match_probability"] >= probability_threshold:
-            G.add_edge(edge["unique_id_l"], edge["unique_id_r"])
-
-    connected_components = list(nx.connected_components(G))
-
-    nx_clusters = pd.DataFrame(
-        [
-            {"unique_id": node, "cluster_id": i}
-            for i, component in enumerate(connected_components)
-            for node in component
-        ]
+def validate_against_reference(clusters, nodes, edges_without_self_loops, probability_threshold):
+    comparison = validation.validate(
+        clusters, nodes, edges_without_self_loops, probability_threshold
     )
-    cluster_stats_query = """
-    SELECT
-        COUNT(DISTINCT cluster_id) AS num_clusters,
-        AVG(cluster_size) AS avg_cluster_size
-    FROM (
-        SELECT
-            cluster_id,
-            COUNT(*) AS cluster_size
-        FROM nx_clusters
-        GROUP BY cluster_id
-    )
-    """
-
-    duckdb.register("nx_clusters", nx_clusters)
-
-    print("NetworkX Clustering Results:")
-
-    print(duckdb.sql(cluster_stats_query))
+    print(f"Validation against reference clustering at {probability_threshold}:")
+    print(comparison)
 
 
 def perform_clustering(nodes, edges_without_self_loops, probability_threshold=0.5):
@@ -90,22 +60,21 @@ def perform_clustering(nodes, edges_without_self_loops, probability_threshold=0.
         CREATE OR REPLACE TABLE updated_representatives AS
         SELECT
             n.node_id,
-            MIN(r2.representative) AS representative
+            MIN(r2.representative) AS representative,
+            -- Every node is its own neighbour, so this carries its old representative
+            MIN(r2.representative) < MIN(r2.representative)
+                FILTER (WHERE n.neighbour = n.node_id) AS changed
         FROM neighbours AS n
         LEFT JOIN representatives AS r2
         ON n.neighbour = r2.node_id
         GROUP BY n.node_id
         """)
 
+        # The update step flags the nodes whose representative changed
         changes = duckdb.execute("""
         SELECT COUNT(*) AS changes
-        FROM (
-            SELECT r.node_id
-            FROM representatives AS r
-            JOIN updated_representatives AS u
-            ON r.node_id = u.node_id
-            WHERE r.representative <> u.representative
-        ) AS diff
+        FROM updated_representatives
+        WHERE changed
         """).fetchone()[0]
 
         print(
@@ -249,5 +218,10 @@ cluster_stats_query = """
     )
     """
 print(duckdb.sql(cluster_stats_query))
-# Validate the clusters using NetworkX
-validate_with_networkx(nodes, edges_without_self_loops, NEW_THRESHOLD)
+# Validate the clusters against an in-memory reference clustering
+validate_against_reference(
+    duckdb.sql("select * from final_result").df(),
+    nodes,
+    edges_without_self_loops,
+    NEW_THRESHOLD,
+)
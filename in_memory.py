@@ -0,0 +1,117 @@
+import numpy as np
+
+try:
+    from scipy.sparse import coo_array
+    from scipy.sparse.csgraph import connected_components as _scipy_components
+except ImportError:
+    _scipy_components = None
+
+# In-process connected components for graphs which fit in memory.
+#
+# Works directly on arrays of ids rather than round tripping through DuckDB,
+# using scipy's CSR-based traversal if scipy is installed and otherwise a
+# vectorised hook-and-shortcut (FastSV style) union-find in NumPy.
+#
+# `find` and `union` are a plain Python union-find, shared by the loops which
+# feed edges through one at a time, such as multi_threshold's sweep.
+
+
+def find(parent, x):
+    """Find the root of `x` in the forest `parent`, halving its path.
+
+    `parent` maps each node to its parent, and can be a list of positions or
+    a dict.  Roots are their own parent.
+    """
+    while parent[x] != x:
+        parent[x] = parent[parent[x]]
+        x = parent[x]
+    return x
+
+
+def union(parent, x, y):
+    """Join the trees of `x` and `y` in `parent` under the smaller root.
+
+    Keeping the smaller root means each root is its tree's minimum node.
+    Returns the `(root, child)` pair of roots joined, or None if `x` and `y`
+    were already in the same tree.
+    """
+    root_x, root_y = find(parent, x), find(parent, y)
+    if root_x == root_y:
+        return None
+    root, child = min(root_x, root_y), max(root_x, root_y)
+    parent[child] = root
+    return root, child
+
+
+def _numpy_components(n, left, right):
+    # Every position points at a position no larger than itself, and at the
+    # fixpoint each component is a star around its smallest position
+    f = np.arange(n)
+    while True:
+        grandparents = f[f]
+        hooked = grandparents.copy()
+        # Hook each node's parent, and the node itself, onto the smallest
+        # grandparent across its edges
+        np.minimum.at(hooked, f[left], grandparents[right])
+        np.minimum.at(hooked, f[right], grandparents[left])
+        np.minimum.at(hooked, left, grandparents[right])
+        np.minimum.at(hooked, right, grandparents[left])
+        if np.array_equal(hooked, f):
+            return f
+        f = hooked
+
+
+def _smallest_position(labels):
+    """Map arbitrary component labels to the smallest position in each."""
+    smallest = np.full(labels.max() + 1, len(labels))
+    np.minimum.at(smallest, labels, np.arange(len(labels)))
+    return smallest[labels]
+
+
+def node_positions(node_ids, ids):
+    """Find the position of each of `ids` in the sorted array `node_ids`.
+
+    Raises ValueError if any of `ids` is not in `node_ids`, rather than
+    silently mapping it to a neighbouring node.
+    """
+    ids = np.asarray(ids)
+    positions = np.searchsorted(node_ids, ids)
+    found = positions < len(node_ids)
+    found[found] = node_ids[positions[found]] == ids[found]
+    if not found.all():
+        missing = ids[~found]
+        raise ValueError(
+            f"{len(missing)} edge ends are not in the nodes, e.g. {missing[:1].tolist()[0]!r}"
+        )
+    return positions
+
+
+def component_labels(node_ids, unique_id_l, unique_id_r, use_scipy=None):
+    """Label each of `node_ids` with the minimum id in its connected component.
+
+    `unique_id_l` and `unique_id_r` are the ends of each edge, and must all be
+    in `node_ids`, otherwise ValueError is raised.  `use_scipy` defaults to
+    using scipy if it is installed.
+
+    Returns a pair of arrays: the sorted node ids and their cluster ids.
+    """
+    if use_scipy is None:
+        use_scipy = _scipy_components is not None
+
+    node_ids = np.unique(np.asarray(node_ids))
+    n = len(node_ids)
+    left = node_positions(node_ids, unique_id_l)
+    right = node_positions(node_ids, unique_id_r)
+
+    if n == 0:
+        return node_ids, node_ids
+    if use_scipy:
+        graph = coo_array(
+            (np.ones(len(left), dtype=np.int8), (left, right)), shape=(n, n)
+        ).tocsr()
+        _, labels = _scipy_components(graph, directed=False)
+        positions = _smallest_position(labels)
+    else:
+        positions = _numpy_components(n, left, right)
+
+    return node_ids, node_ids[positions]
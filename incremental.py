@@ -0,0 +1,544 @@
+import logging
+
+import duckdb
+import pandas as pd
+
+import connected_components as cc
+import multi_threshold as mt
+
+# Updating an existing clustering without clustering from scratch.
+#
+# hierarchical.py and union_find_at_multi_probability_hierarchical.py
+# prototype the idea for raising the threshold: a cluster none of whose
+# internal edges fall below the new threshold can't split, so it is frozen
+# (a stable cluster) and only the nodes in the remaining clusters (the nodes
+# in play) are reclustered.  Lowering the threshold is the mirror image: only
+# clusters touched by a newly admitted edge between two clusters can merge.
+#
+# New edges are handled the same way as a lowered threshold, except that the
+# clusters they touch are contracted to single nodes, so the work done is
+# proportional to the batch of new edges rather than to the clusters they
+# touch.  Removed edges are the mirror image again: only a cluster which
+# loses one of its internal edges can split, so only those are reclustered.
+
+logger = logging.getLogger(__name__)
+
+
+def _recluster(
+    ws, previous_clusters, edges, new_threshold, previous_threshold, raising, algorithm
+):
+    """Recluster the nodes in play, writing the result to the `clusters` table.
+
+    Returns the `clusters` table name and a dict of statistics about how much
+    of the graph was skipped.
+    """
+    changed_clusters = ws.table("changed_clusters")
+    nodes_in_play = ws.table("nodes_in_play")
+    edges_in_play = ws.table("edges_in_play")
+    new_clusters = ws.table("new_clusters")
+    clusters = ws.table("clusters")
+
+    edges_with_clusters = f"""
+    SELECT e.match_probability, cl.cluster_id AS cluster_id_l, cr.cluster_id AS cluster_id_r
+    FROM {edges} AS e
+    JOIN {previous_clusters} AS cl ON e.unique_id_l = cl.unique_id
+    JOIN {previous_clusters} AS cr ON e.unique_id_r = cr.unique_id
+    WHERE e.unique_id_l <> e.unique_id_r
+    """
+    if raising:
+        # Clusters which lose an internal edge may split
+        band = f"match_probability < {new_threshold}"
+        if previous_threshold is not None:
+            band += f" AND match_probability >= {previous_threshold}"
+        changed_clusters_query = f"""
+        WITH edges_with_clusters AS ({edges_with_clusters})
+        SELECT DISTINCT cluster_id_l AS cluster_id
+        FROM edges_with_clusters
+        WHERE cluster_id_l = cluster_id_r
+        AND {band}
+        """
+    else:
+        # Clusters joined by a newly admitted edge may merge
+        band = f"match_probability >= {new_threshold}"
+        if previous_threshold is not None:
+            band += f" AND match_probability < {previous_threshold}"
+        changed_clusters_query = f"""
+        WITH edges_with_clusters AS ({edges_with_clusters}),
+        new_edges AS (
+            SELECT cluster_id_l, cluster_id_r
+            FROM edges_with_clusters
+            WHERE cluster_id_l <> cluster_id_r
+            AND {band}
+        )
+        SELECT cluster_id_l AS cluster_id FROM new_edges
+        UNION
+        SELECT cluster_id_r AS cluster_id FROM new_edges
+        """
+    ws.execute(f"CREATE OR REPLACE TABLE {changed_clusters} AS {changed_clusters_query}")
+
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {nodes_in_play} AS
+    SELECT p.unique_id
+    FROM {previous_clusters} AS p
+    SEMI JOIN {changed_clusters} AS c
+    ON p.cluster_id = c.cluster_id
+    """)
+
+    # Any edge at or above the new threshold which touches a node in play has
+    # both ends in play
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {edges_in_play} AS
+    SELECT e.unique_id_l, e.unique_id_r, e.match_probability
+    FROM {edges} AS e
+    SEMI JOIN {nodes_in_play} AS n
+    ON e.unique_id_l = n.unique_id
+    WHERE e.match_probability >= {new_threshold}
+    """)
+
+    cluster_ws = cc._Workspace(ws.con)
+    try:
+        reclustered = cc._cluster_in_workspace(
+            cluster_ws, nodes_in_play, edges_in_play, None, algorithm
+        )
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {new_clusters} AS
+        SELECT unique_id, cluster_id
+        FROM {reclustered}
+        """)
+    finally:
+        cluster_ws.cleanup()
+
+    # Stable clusters are carried over unchanged
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {clusters} AS
+    SELECT p.unique_id, p.cluster_id
+    FROM {previous_clusters} AS p
+    ANTI JOIN {changed_clusters} AS c
+    ON p.cluster_id = c.cluster_id
+    UNION ALL
+    SELECT unique_id, cluster_id
+    FROM {new_clusters}
+    """)
+
+    total_nodes, nodes_reclustered = ws.execute(f"""
+    SELECT
+        (SELECT COUNT(*) FROM {previous_clusters}),
+        (SELECT COUNT(*) FROM {nodes_in_play})
+    """).fetchone()
+    stats = {
+        "threshold": new_threshold,
+        "total_nodes": total_nodes,
+        "nodes_in_play": nodes_reclustered,
+        "edges_in_play": ws.execute(
+            f"SELECT COUNT(*) FROM {edges_in_play}"
+        ).fetchone()[0],
+        "fraction_skipped": 1 - nodes_reclustered / total_nodes if total_nodes else 1,
+    }
+    logger.info(
+        f"Threshold {new_threshold}: reclustered {nodes_reclustered} of "
+        f"{total_nodes} nodes"
+    )
+    return clusters, stats
+
+
+def _recluster_at_threshold(
+    previous_clusters,
+    edges,
+    new_threshold,
+    previous_threshold,
+    raising,
+    algorithm,
+    con,
+    output,
+):
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        clusters, _ = _recluster(
+            ws,
+            ws.register("previous_clusters", previous_clusters),
+            ws.register("edges", edges),
+            new_threshold,
+            previous_threshold,
+            raising,
+            algorithm,
+        )
+        return cc._fetch(
+            ws,
+            f"""
+            SELECT unique_id, cluster_id
+            FROM {clusters}
+            ORDER BY cluster_id, unique_id
+            """,
+            output,
+        )
+    finally:
+        ws.cleanup()
+
+
+def recluster_at_higher_threshold(
+    previous_clusters,
+    edges,
+    new_threshold,
+    previous_threshold=None,
+    algorithm="breadth_first",
+    con=None,
+    output=None,
+):
+    """Recluster `previous_clusters` at a higher match_probability threshold.
+
+    Only clusters with an internal edge below `new_threshold` are reclustered,
+    every other cluster keeps its cluster_id.  If `previous_threshold` (the
+    threshold `previous_clusters` was made at) is given, internal edges below
+    it are ignored, so fewer clusters need reclustering.
+
+    `previous_clusters` has `unique_id, cluster_id` columns and `edges` is as
+    for `connected_components.cluster`, with a `match_probability` column.
+    Returns a DataFrame of `unique_id, cluster_id`, or with an `output` path
+    writes it to that Parquet file, as for `connected_components.cluster`.
+    """
+    return _recluster_at_threshold(
+        previous_clusters,
+        edges,
+        new_threshold,
+        previous_threshold,
+        True,
+        algorithm,
+        con,
+        output,
+    )
+
+
+def recluster_at_lower_threshold(
+    previous_clusters,
+    edges,
+    new_threshold,
+    previous_threshold=None,
+    algorithm="breadth_first",
+    con=None,
+    output=None,
+):
+    """Recluster `previous_clusters` at a lower match_probability threshold.
+
+    Only clusters joined to another cluster by an edge at or above
+    `new_threshold` are reclustered.  Arguments are as for
+    `recluster_at_higher_threshold`.
+    """
+    return _recluster_at_threshold(
+        previous_clusters,
+        edges,
+        new_threshold,
+        previous_threshold,
+        False,
+        algorithm,
+        con,
+        output,
+    )
+
+
+def cluster_threshold_ladder(
+    nodes, edges, thresholds, ascending=True, algorithm="breadth_first", con=None
+):
+    """Cluster at each threshold in turn, reclustering only what can change.
+
+    The first threshold of the ladder (the lowest if `ascending`, otherwise
+    the highest) is clustered in full.  Each later threshold starts from the
+    clusters at the one before.
+
+    Returns a DataFrame in the format of
+    `multi_threshold.cluster_at_thresholds`, and a DataFrame with a row of
+    statistics per step, including the fraction of nodes skipped.
+    """
+    if con is None:
+        con = duckdb.connect()
+
+    thresholds = sorted(thresholds, reverse=not ascending)
+    ws = cc._Workspace(con)
+    try:
+        nodes_table = ws.register("nodes", nodes)
+        edges_table = ws.register("edges", edges)
+        previous_clusters = ws.table("previous_clusters")
+
+        cluster_ws = cc._Workspace(con)
+        try:
+            first_clusters = cc._cluster_in_workspace(
+                cluster_ws, nodes_table, edges_table, thresholds[0], algorithm
+            )
+            ws.execute(f"""
+            CREATE OR REPLACE TABLE {previous_clusters} AS
+            SELECT unique_id, cluster_id
+            FROM {first_clusters}
+            """)
+        finally:
+            cluster_ws.cleanup()
+
+        results = {}
+        steps = []
+        previous_threshold = thresholds[0]
+        for threshold in thresholds:
+            if threshold != previous_threshold:
+                clusters, stats = _recluster(
+                    ws,
+                    previous_clusters,
+                    edges_table,
+                    threshold,
+                    previous_threshold,
+                    ascending,
+                    algorithm,
+                )
+                ws.replace(previous_clusters, clusters)
+                steps.append(stats)
+
+            results[threshold] = ws.execute(f"""
+            SELECT unique_id, cluster_id
+            FROM {previous_clusters}
+            ORDER BY unique_id
+            """).fetchnumpy()
+            previous_threshold = threshold
+    finally:
+        ws.cleanup()
+
+    columns = {"unique_id": results[thresholds[0]]["unique_id"]}
+    for threshold in sorted(thresholds):
+        columns[mt.threshold_column(threshold)] = results[threshold]["cluster_id"]
+    return pd.DataFrame(columns), pd.DataFrame(steps)
+
+
+def add_edges(
+    clusters,
+    new_edges,
+    threshold=None,
+    algorithm="breadth_first",
+    changes_only=False,
+    con=None,
+    output=None,
+):
+    """Update `clusters` with a batch of `new_edges`, without reclustering.
+
+    `clusters` has `unique_id, cluster_id` columns, where the cluster_id is
+    the minimum unique_id in the cluster, as produced by
+    `connected_components.cluster`.  `new_edges` is as for
+    `connected_components.cluster`, and only those at or above `threshold`
+    are added, if it's given.  Nodes in `new_edges` which aren't in
+    `clusters` are added to the clustering.
+
+    Each new edge is mapped to the clusters of its ends, and `algorithm` is
+    run on this graph of clusters alone.  Clusters which it joins are merged
+    under the smallest of their cluster_ids.
+
+    Returns a DataFrame of `unique_id, cluster_id` for every node, or with
+    `changes_only` just for the nodes which are new or whose cluster_id
+    changed, ordered by cluster_id and unique_id.  With an `output` path it
+    is written to that Parquet file instead, as for
+    `connected_components.cluster`.
+    """
+    cc._check_algorithm(algorithm)
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        previous_clusters = ws.register("previous_clusters", clusters)
+        edges = ws.register("new_edges", new_edges)
+        batch_edges = ws.table("batch_edges")
+        added_nodes = ws.table("added_nodes")
+        updated = ws.table("updated")
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {batch_edges} AS
+        SELECT unique_id_l, unique_id_r
+        FROM {edges}
+        WHERE unique_id_l <> unique_id_r
+        {cc._threshold_filter(threshold)}
+        """)
+
+        # Nodes first seen in this batch start as singletons
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {added_nodes} AS
+        WITH ends AS (
+            SELECT unique_id_l AS unique_id FROM {batch_edges}
+            UNION
+            SELECT unique_id_r AS unique_id FROM {batch_edges}
+        )
+        SELECT e.unique_id, e.unique_id AS cluster_id
+        FROM ends AS e
+        ANTI JOIN {previous_clusters} AS p ON e.unique_id = p.unique_id
+        """)
+
+        # The clusters which the new edges join, with nodes first seen in the
+        # batch as clusters of their own
+        merged, _ = cc._merge_clusters(
+            ws,
+            f"""(
+                SELECT unique_id, cluster_id FROM {previous_clusters}
+                UNION ALL
+                SELECT unique_id, cluster_id FROM {added_nodes}
+            )""",
+            batch_edges,
+            algorithm,
+        )
+
+        # Only the nodes of clusters which merged into another are relabelled
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {updated} AS
+        SELECT p.unique_id, COALESCE(m.cluster_id, p.cluster_id) AS cluster_id
+        FROM {added_nodes} AS p
+        LEFT JOIN {merged} AS m ON p.cluster_id = m.old_cluster_id
+        UNION ALL
+        SELECT p.unique_id, m.cluster_id
+        FROM {previous_clusters} AS p
+        JOIN {merged} AS m ON p.cluster_id = m.old_cluster_id
+        """)
+
+        batch_size, clusters_merged, nodes_updated = ws.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM {batch_edges}),
+            (SELECT COUNT(*) FROM {merged}),
+            (SELECT COUNT(*) FROM {updated})
+        """).fetchone()
+        logger.info(
+            f"Added {batch_size} edges: {clusters_merged} clusters merged into "
+            f"others, {nodes_updated} nodes new or relabelled"
+        )
+
+        if changes_only:
+            result = f"SELECT unique_id, cluster_id FROM {updated}"
+        else:
+            result = f"""
+            SELECT p.unique_id, p.cluster_id
+            FROM {previous_clusters} AS p
+            ANTI JOIN {merged} AS m ON p.cluster_id = m.old_cluster_id
+            UNION ALL
+            SELECT unique_id, cluster_id
+            FROM {updated}
+            """
+        return cc._fetch(
+            ws,
+            f"""
+            SELECT unique_id, cluster_id
+            FROM ({result})
+            ORDER BY cluster_id, unique_id
+            """,
+            output,
+        )
+    finally:
+        ws.cleanup()
+
+
+def remove_edges(
+    clusters,
+    edges,
+    removed_edges,
+    threshold=None,
+    algorithm="breadth_first",
+    changes_only=False,
+    con=None,
+    output=None,
+):
+    """Update `clusters` after `removed_edges` are retracted from the graph.
+
+    `clusters` is as for `add_edges`, `edges` are the edges which remain, and
+    `removed_edges` those which have been retracted, both as for
+    `connected_components.cluster`.  Only edges at or above `threshold` count,
+    if it's given.
+
+    Only the clusters which lost an internal edge can split, so only their
+    nodes are reclustered, with `algorithm`, and every other cluster keeps
+    its cluster_id.  Of the pieces of a split cluster, the one holding its
+    minimum unique_id keeps the cluster_id.
+
+    Returns a DataFrame of `unique_id, cluster_id` for every node, or with
+    `changes_only` just for the nodes whose cluster_id changed, ordered by
+    cluster_id and unique_id.  `output` is as for `add_edges`.
+    """
+    cc._check_algorithm(algorithm)
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        previous_clusters = ws.register("previous_clusters", clusters)
+        remaining_edges = ws.register("edges", edges)
+        retracted_edges = ws.register("removed_edges", removed_edges)
+        changed_clusters = ws.table("changed_clusters")
+        nodes_in_play = ws.table("nodes_in_play")
+        edges_in_play = ws.table("edges_in_play")
+        split = ws.table("split")
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {changed_clusters} AS
+        SELECT DISTINCT cl.cluster_id
+        FROM {retracted_edges} AS e
+        JOIN {previous_clusters} AS cl ON e.unique_id_l = cl.unique_id
+        JOIN {previous_clusters} AS cr ON e.unique_id_r = cr.unique_id
+        WHERE e.unique_id_l <> e.unique_id_r
+        AND cl.cluster_id = cr.cluster_id
+        {cc._threshold_filter(threshold)}
+        """)
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {nodes_in_play} AS
+        SELECT p.unique_id
+        FROM {previous_clusters} AS p
+        SEMI JOIN {changed_clusters} AS c
+        ON p.cluster_id = c.cluster_id
+        """)
+
+        # The remaining edges can't join two clusters, so any which touches a
+        # node in play has both ends in play
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {edges_in_play} AS
+        SELECT e.unique_id_l, e.unique_id_r
+        FROM {remaining_edges} AS e
+        SEMI JOIN {nodes_in_play} AS n
+        ON e.unique_id_l = n.unique_id
+        WHERE e.unique_id_l <> e.unique_id_r
+        {cc._threshold_filter(threshold)}
+        """)
+
+        cluster_ws = cc._Workspace(con)
+        try:
+            reclustered = cc._cluster_in_workspace(
+                cluster_ws, nodes_in_play, edges_in_play, None, algorithm
+            )
+            ws.execute(f"""
+            CREATE OR REPLACE TABLE {split} AS
+            SELECT r.unique_id, r.cluster_id
+            FROM {reclustered} AS r
+            JOIN {previous_clusters} AS p ON r.unique_id = p.unique_id
+            WHERE r.cluster_id <> p.cluster_id
+            """)
+        finally:
+            cluster_ws.cleanup()
+
+        clusters_changed, nodes_reclustered, nodes_updated = ws.execute(f"""
+        SELECT
+            (SELECT COUNT(*) FROM {changed_clusters}),
+            (SELECT COUNT(*) FROM {nodes_in_play}),
+            (SELECT COUNT(*) FROM {split})
+        """).fetchone()
+        logger.info(
+            f"Removed edges touched {clusters_changed} clusters: reclustered "
+            f"{nodes_reclustered} nodes, {nodes_updated} relabelled"
+        )
+
+        if changes_only:
+            result = f"SELECT unique_id, cluster_id FROM {split}"
+        else:
+            result = f"""
+            SELECT p.unique_id, COALESCE(s.cluster_id, p.cluster_id) AS cluster_id
+            FROM {previous_clusters} AS p
+            LEFT JOIN {split} AS s ON p.unique_id = s.unique_id
+            """
+        return cc._fetch(
+            ws,
+            f"""
+            SELECT unique_id, cluster_id
+            FROM ({result})
+            ORDER BY cluster_id, unique_id
+            """,
+            output,
+        )
+    finally:
+        ws.cleanup()
@@ -0,0 +1,377 @@
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import tempfile
+
+import duckdb
+import numpy as np
+import pandas as pd
+
+import connected_components as cc
+import in_memory
+
+# Clustering at many match_probability thresholds at once.
+#
+# union_find_at_multi_probability.py runs a full label propagation loop per
+# threshold.  Here the default method, "sweep", instead sorts the edges by
+# match_probability once and feeds them, highest first, through a single
+# union-find, reading off the clusters each time a threshold is crossed
+# (i.e. Kruskal's algorithm, stopped at every threshold).
+#
+# The "incremental" method stays in DuckDB.  It works down the thresholds,
+# contracting each existing cluster to a single super-node, so only the
+# edges newly admitted at each threshold need to be clustered.
+
+logger = logging.getLogger(__name__)
+
+METHODS = ("sweep", "incremental", "independent")
+
+
+def threshold_column(threshold):
+    return f"cluster_id_at_{str(threshold).replace('.', '_')}"
+
+
+# The sorted edges are fetched this many DuckDB vectors (of 2048 rows) at a
+# time, so only one batch of them is ever held as Python objects
+_VECTORS_PER_BATCH = 100
+
+
+def _sorted_edges(ws, min_threshold):
+    """Fetch the sorted node ids, and the edges at or above `min_threshold`
+    as positions in them, highest match_probability first.
+
+    The edges are a generator of `(left, right, probabilities)` batches of
+    lists, which must be consumed before anything else is run on `ws`.
+    """
+    nodes = ws.table("nodes")
+    edges = ws.table("edges")
+
+    node_ids = np.sort(
+        ws.execute(f"SELECT unique_id FROM {nodes}").fetchnumpy()["unique_id"]
+    )
+
+    result = ws.execute(f"""
+    SELECT unique_id_l, unique_id_r, match_probability
+    FROM {edges}
+    WHERE unique_id_l <> unique_id_r
+    {cc._threshold_filter(min_threshold)}
+    ORDER BY match_probability DESC
+    """)
+
+    def batches():
+        while True:
+            batch = result.fetch_df_chunk(_VECTORS_PER_BATCH)
+            if batch.empty:
+                return
+            # The union-find loops index lists, which is about twice as fast
+            # as indexing NumPy arrays element by element
+            yield (
+                in_memory.node_positions(node_ids, batch["unique_id_l"]).tolist(),
+                in_memory.node_positions(node_ids, batch["unique_id_r"]).tolist(),
+                batch["match_probability"].tolist(),
+            )
+
+    return node_ids, batches()
+
+
+def _compress(parent):
+    """Point every position in a parent array directly at its root."""
+    roots = np.asarray(parent)
+    while True:
+        next_roots = roots[roots]
+        if np.array_equal(next_roots, roots):
+            return roots
+        roots = next_roots
+
+
+def _sweep(ws, thresholds):
+    # Edges which will be admitted at some threshold, highest first
+    node_ids, batches = _sorted_edges(ws, min(thresholds))
+
+    # Nodes are positions in the sorted node_ids, and a tree's root is always
+    # its smallest position, so the root is the cluster's minimum unique_id.
+    # parent is a list, as it's indexed from Python on every edge.
+    parent = list(range(len(node_ids)))
+
+    clusters = {}
+    pending = sorted(thresholds, reverse=True)
+    admitted = 0
+
+    def record(threshold):
+        roots = _compress(parent)
+        clusters[threshold] = node_ids[roots]
+        logger.info(
+            f"Threshold {threshold}: {admitted} edges admitted, "
+            f"{len(np.unique(roots))} clusters"
+        )
+
+    for left, right, probabilities in batches:
+        for l, r, probability in zip(left, right, probabilities):
+            # Every edge is at or above the lowest threshold, so the edges
+            # run out before the thresholds do
+            while probability < pending[0]:
+                record(pending.pop(0))
+            in_memory.union(parent, l, r)
+            admitted += 1
+    for threshold in pending:
+        record(threshold)
+
+    return node_ids, clusters
+
+
+def _incremental(ws, thresholds, algorithm="breadth_first"):
+    nodes = ws.table("nodes")
+    edges = ws.table("edges")
+    sorted_edges = ws.table("sorted_edges")
+    clusters = ws.table("clusters")
+
+    # Sorting by match_probability means each band of edges sits in a few
+    # row groups, which DuckDB can find from their min/max statistics
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {sorted_edges} AS
+    SELECT unique_id_l, unique_id_r, match_probability
+    FROM {edges}
+    WHERE unique_id_l <> unique_id_r
+    AND match_probability >= {min(thresholds)}
+    ORDER BY match_probability
+    """)
+
+    # Above the highest threshold every node is its own cluster
+    ws.execute(f"""
+    CREATE OR REPLACE TABLE {clusters} AS
+    SELECT unique_id, unique_id AS cluster_id
+    FROM {nodes}
+    """)
+
+    node_ids = ws.execute(
+        f"SELECT unique_id FROM {clusters} ORDER BY unique_id"
+    ).fetchnumpy()["unique_id"]
+
+    results = {}
+    previous_threshold = None
+    for threshold in sorted(thresholds, reverse=True):
+        band = f"match_probability >= {threshold}"
+        if previous_threshold is not None:
+            band += f" AND match_probability < {previous_threshold}"
+
+        # Merge the clusters at the previous threshold which the newly
+        # admitted edges join
+        merged, new_edges = cc._merge_clusters(
+            ws,
+            clusters,
+            f"(SELECT unique_id_l, unique_id_r FROM {sorted_edges} WHERE {band})",
+            algorithm,
+        )
+        if new_edges > 0:
+            ws.execute(f"""
+            UPDATE {clusters} AS c
+            SET cluster_id = m.cluster_id
+            FROM {merged} AS m
+            WHERE c.cluster_id = m.old_cluster_id
+            """)
+
+        results[threshold] = ws.execute(
+            f"SELECT cluster_id FROM {clusters} ORDER BY unique_id"
+        ).fetchnumpy()["cluster_id"]
+        logger.info(f"Threshold {threshold}: {new_edges} new edges between clusters")
+        previous_threshold = threshold
+
+    return node_ids, results
+
+
+def _cluster_threshold(nodes_path, edges_path, threshold, algorithm, threads):
+    """Cluster the Parquet graph at one threshold.  Runs in a worker process."""
+    con = duckdb.connect(config={"threads": threads})
+    result = cc.cluster(
+        nodes_path,
+        edges_path,
+        threshold,
+        algorithm=algorithm,
+        con=con,
+    ).sort_values("unique_id")
+    return result["cluster_id"].to_numpy()
+
+
+def _independent(ws, thresholds, algorithm="breadth_first", processes=None):
+    # With `processes`, the thresholds are clustered in parallel by a pool of
+    # worker processes, each with its own connection reading the graph from
+    # Parquet files written once here
+    nodes = ws.table("nodes")
+    edges = ws.table("edges")
+
+    node_ids = np.sort(
+        ws.execute(f"SELECT unique_id FROM {nodes}").fetchnumpy()["unique_id"]
+    )
+    clusters = {}
+    if processes is None:
+        for threshold in thresholds:
+            result = cc.cluster(
+                nodes, edges, threshold, algorithm=algorithm, con=ws.con
+            ).sort_values("unique_id")
+            clusters[threshold] = result["cluster_id"].to_numpy()
+            logger.info(f"Completed threshold {threshold}")
+        return node_ids, clusters
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        nodes_path = os.path.join(tmp_dir, "nodes.parquet")
+        edges_path = os.path.join(tmp_dir, "edges.parquet")
+        ws.execute(f"""
+        COPY (SELECT unique_id FROM {nodes})
+        TO {cc._quote(nodes_path)} (FORMAT PARQUET)
+        """)
+        ws.execute(f"""
+        COPY (
+            SELECT unique_id_l, unique_id_r, match_probability
+            FROM {edges}
+            WHERE match_probability >= {thresholds[0]}
+        )
+        TO {cc._quote(edges_path)} (FORMAT PARQUET)
+        """)
+
+        # Share the cores between the workers rather than each DuckDB
+        # connection starting a thread per core
+        threads = max(1, (os.cpu_count() or 1) // processes)
+        with concurrent.futures.ProcessPoolExecutor(
+            max_workers=processes, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futures = {
+                executor.submit(
+                    _cluster_threshold,
+                    nodes_path,
+                    edges_path,
+                    threshold,
+                    algorithm,
+                    threads,
+                ): threshold
+                for threshold in thresholds
+            }
+            for future in concurrent.futures.as_completed(futures):
+                clusters[futures[future]] = future.result()
+                logger.info(f"Completed threshold {futures[future]}")
+
+    return node_ids, clusters
+
+
+_METHODS = {
+    "sweep": _sweep,
+    "incremental": _incremental,
+    "independent": _independent,
+}
+
+
+def cluster_at_thresholds(
+    nodes, edges, thresholds, method="sweep", con=None, **options
+):
+    """Cluster `nodes` at every match_probability threshold in `thresholds`.
+
+    `nodes` and `edges` are as for `connected_components.cluster`, and
+    `edges` must have a `match_probability` column.  The "incremental" and
+    "independent" methods run `connected_components.cluster`, over the
+    super-node graph and the whole graph respectively, and its `algorithm`
+    may be passed in `options`.  "independent" also takes `processes`, the
+    number of worker processes to cluster the thresholds in parallel.
+
+    Returns a DataFrame with a `unique_id` column and one
+    `cluster_id_at_<threshold>` column per threshold, lowest threshold first,
+    ordered by unique_id.
+    """
+    if method not in _METHODS:
+        raise ValueError(
+            f"Unknown method {method!r}, expected one of {', '.join(METHODS)}"
+        )
+    if con is None:
+        con = duckdb.connect()
+
+    thresholds = sorted(thresholds)
+    ws = cc._Workspace(con)
+    try:
+        ws.register("nodes", nodes)
+        ws.register("edges", edges)
+        node_ids, clusters = _METHODS[method](ws, thresholds, **options)
+    finally:
+        ws.cleanup()
+
+    columns = {"unique_id": node_ids}
+    for threshold in thresholds:
+        columns[threshold_column(threshold)] = clusters[threshold]
+    return pd.DataFrame(columns)
+
+
+def cluster_tree(nodes, edges, min_threshold=None, con=None):
+    """Build the cluster hierarchy over all match_probability thresholds.
+
+    The hierarchy has one row per node, which is also the singleton cluster
+    whose `cluster_id` is that node's unique_id.  As the threshold is lowered,
+    a cluster merges into another with a smaller cluster_id at
+    `threshold_at_merge`, the match_probability of the edge which joins them.
+    At that point it becomes part of `parent_cluster_id`, and `size` is the
+    number of nodes it held just before.  Clusters which never merge have no
+    parent, and `size` is their final size.
+
+    The clusters at any threshold can be read back with
+    `clusters_at_threshold`, so this is much more compact than a column per
+    threshold.  Only edges at or above `min_threshold` are used, if given.
+    """
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        ws.register("nodes", nodes)
+        ws.register("edges", edges)
+        node_ids, batches = _sorted_edges(ws, min_threshold)
+
+        # parent is indexed on every edge so stays a list, while the rest are
+        # only written when two clusters merge
+        n = len(node_ids)
+        parent = list(range(n))
+        size = np.ones(n, dtype=np.int64)
+        merged_into = np.full(n, -1, dtype=np.int64)
+        threshold_at_merge = np.full(n, np.nan)
+        size_at_merge = np.zeros(n, dtype=np.int64)
+
+        for left, right, probabilities in batches:
+            for l, r, probability in zip(left, right, probabilities):
+                joined = in_memory.union(parent, l, r)
+                if joined is None:
+                    continue
+                root, child = joined
+                merged_into[child] = root
+                threshold_at_merge[child] = probability
+                size_at_merge[child] = size[child]
+                size[root] += size[child]
+    finally:
+        ws.cleanup()
+
+    is_root = merged_into < 0
+    parent_cluster_id = pd.Series(node_ids[np.where(is_root, 0, merged_into)])
+    if np.issubdtype(node_ids.dtype, np.integer):
+        parent_cluster_id = parent_cluster_id.astype("Int64")
+
+    return pd.DataFrame(
+        {
+            "cluster_id": node_ids,
+            "parent_cluster_id": parent_cluster_id.mask(is_root),
+            "threshold_at_merge": threshold_at_merge,
+            "size": np.where(is_root, size, size_at_merge),
+        }
+    )
+
+
+def clusters_at_threshold(tree, threshold):
+    """Read the clusters at `threshold` from a `cluster_tree`.
+
+    Returns a DataFrame of `unique_id, cluster_id`, ordered by unique_id.
+    """
+    tree = tree.sort_values("cluster_id")
+    node_ids = tree["cluster_id"].to_numpy()
+    merged = (tree["threshold_at_merge"] >= threshold).to_numpy()
+
+    positions = np.arange(len(node_ids))
+    parent_ids = tree["parent_cluster_id"].where(merged, tree["cluster_id"])
+    parent_positions = np.searchsorted(
+        node_ids, parent_ids.to_numpy(dtype=node_ids.dtype)
+    )
+    roots = _compress(np.where(merged, parent_positions, positions))
+    return pd.DataFrame({"unique_id": node_ids, "cluster_id": node_ids[roots]})
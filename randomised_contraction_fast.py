@@ -3,10 +3,9 @@ import string
 import time
 
 import duckdb
-import networkx as nx  # For validating answer
-import pandas as pd
 
 import generate_random_graphs as gen
+import validation
 
 random.seed(42)  # Set a fixed seed for reproducibility
 
@@ -128,30 +127,11 @@ execution_time = end_time - start_time
 print(f"Core graph solving algorithm execution time: {execution_time:.2f} seconds")
 
 
-# Validate the clusters using NetworkX
-# Build the graph using NetworkX
-edges_df = duckdb.execute(
-    "SELECT unique_id_l, unique_id_r FROM edges_without_self_loops"
-).fetchdf()
-G = nx.Graph()
-G.add_edges_from(edges_df.values)
+# Validate the clusters against an in-memory reference clustering
+comparison = validation.validate(our_clusters, nodes, edges_without_self_loops)
 
-# Get the connected components from NetworkX
-nx_components = list(nx.connected_components(G))
-# Assign cluster ids
-nx_cluster_df = pd.DataFrame(
-    [(node, idx) for idx, component in enumerate(nx_components) for node in component],
-    columns=["unique_id", "nx_cluster_id"],
-)
-
-# Merge our clusters with NetworkX clusters
-merged_clusters = our_clusters.merge(nx_cluster_df, on="unique_id")
-
-# Check if the clusterings match
-# Since the cluster IDs may not match, we check that for each of our clusters, the set of nodes matches the corresponding NetworkX cluster
-grouped_our_clusters = merged_clusters.groupby("cluster_id")["nx_cluster_id"].nunique()
-
-if grouped_our_clusters.eq(1).all():
-    print("Clustering matches with NetworkX connected components.")
+if comparison["match"]:
+    print("Clustering matches the reference connected components.")
 else:
-    print("Clustering does not match with NetworkX connected components.")
+    print("Clustering does not match the reference connected components.")
+    print(comparison)
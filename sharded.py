@@ -0,0 +1,126 @@
+import logging
+
+import duckdb
+
+import connected_components as cc
+
+# Clustering graphs too large to cluster in one piece.
+#
+# The edges are hash-partitioned into shards, and folded into a running
+# clustering one shard at a time.  Every node starts in its own cluster.  Each
+# shard's edges are contracted onto the current clusters at their ends, so
+# the graph clustered for a shard has at most as many edges as the shard, and
+# fewer as the clusters grow.  The clusters it merges are then relabelled with
+# the smallest of their cluster ids.  Since cluster ids are always minimum
+# unique_ids, after the last shard each cluster_id is the minimum unique_id
+# in its connected component.
+#
+# Partitioning the nodes instead would leave most edges between shards,
+# since a hash of the unique_id ignores the structure of the graph, so a
+# final pass over those edges would be nearly as large as the whole graph.
+#
+# The shards run one after another on the same connection.  With a
+# `memory_limit` and a file-backed database or `temp_directory`, DuckDB
+# spills whatever does not fit to disk.
+
+logger = logging.getLogger(__name__)
+
+
+def _shard(num_shards):
+    return f"hash(unique_id_l, unique_id_r) % {num_shards}"
+
+
+def cluster_sharded(
+    nodes,
+    edges,
+    threshold=None,
+    num_shards=8,
+    algorithm="breadth_first",
+    con=None,
+    metrics=None,
+    remap_ids=None,
+    reduce_graph=False,
+    output=None,
+    **options,
+):
+    """Cluster `nodes` into connected components one shard of edges at a time.
+
+    Takes the same `nodes`, `edges` and `threshold` as
+    `connected_components.cluster`.  The edges are split into `num_shards`
+    shards, and each shard, contracted onto the clusters found so far, is
+    clustered with `algorithm`.  `remap_ids`, `reduce_graph` and any further
+    keyword `options` are passed on as for `connected_components.cluster`,
+    and apply to each shard separately.
+
+    If `metrics` is a list, the per-iteration metrics of every run are
+    appended to it, with a `shard` key giving the shard number and
+    `shard_edges` the number of edges clustered for it.
+
+    Returns a DataFrame of `unique_id, cluster_id`, where the cluster_id is the
+    minimum unique_id in the cluster, ordered by cluster_id and unique_id, or
+    with an `output` path writes it to that Parquet file, as for
+    `connected_components.cluster`.
+    """
+    cc._check_algorithm(algorithm)
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        input_nodes = ws.register("nodes", nodes)
+        input_edges = ws.register("edges", edges)
+        clusters = ws.table("clusters")
+
+        ws.execute(f"""
+        CREATE OR REPLACE TABLE {clusters} AS
+        SELECT unique_id, unique_id AS cluster_id
+        FROM {input_nodes}
+        """)
+
+        for shard in range(num_shards):
+            shard_metrics = [] if metrics is not None else None
+            merged, num_edges = cc._merge_clusters(
+                ws,
+                clusters,
+                f"""(
+                    SELECT unique_id_l, unique_id_r
+                    FROM {input_edges}
+                    WHERE {_shard(num_shards)} = {shard}
+                    {cc._threshold_filter(threshold)}
+                )""",
+                algorithm,
+                shard_metrics,
+                remap_ids,
+                reduce_graph,
+                options,
+            )
+            logger.info(
+                f"Clustered shard {shard + 1} of {num_shards}: "
+                f"{num_edges} edges between clusters"
+            )
+            if num_edges == 0:
+                continue
+            if metrics is not None:
+                metrics.extend(
+                    {"shard": shard, "shard_edges": num_edges, **m}
+                    for m in shard_metrics
+                )
+
+            ws.execute(f"""
+            UPDATE {clusters} AS c
+            SET cluster_id = m.cluster_id
+            FROM {merged} AS m
+            WHERE c.cluster_id = m.old_cluster_id
+            """)
+
+        return cc._fetch(
+            ws,
+            f"""
+            SELECT unique_id, cluster_id
+            FROM {clusters}
+            ORDER BY cluster_id, unique_id
+            """,
+            output,
+        )
+    finally:
+        ws.cleanup()
@@ -0,0 +1,493 @@
+import duckdb
+import numpy as np
+import pandas as pd
+import pytest
+
+import connected_components as cc
+import generate_random_graphs as gen
+import in_memory
+import incremental
+import multi_threshold as mt
+import sharded
+import validation
+
+# Checks every algorithm against in_memory.component_labels, e.g.
+#
+#   python -m pytest -q test_connected_components.py
+
+THRESHOLD = 0.5
+THRESHOLDS = [0.2, 0.5, 0.8]
+
+
+def _random_graph(num_nodes=300, num_edges=400, seed=1):
+    rng = np.random.default_rng(seed)
+    nodes = pd.DataFrame({"unique_id": np.arange(num_nodes)})
+    edges = pd.DataFrame(
+        {
+            "unique_id_l": rng.integers(0, num_nodes, num_edges),
+            "unique_id_r": rng.integers(0, num_nodes, num_edges),
+            "match_probability": rng.random(num_edges),
+        }
+    )
+    return nodes, edges
+
+
+def _chain_graph(num_nodes=200, seed=2):
+    # Shuffled ids, so the minimum id isn't at one end of the chain
+    ids = np.random.default_rng(seed).permutation(num_nodes)
+    nodes = pd.DataFrame({"unique_id": np.arange(num_nodes)})
+    edges = pd.DataFrame(
+        {
+            "unique_id_l": ids[:-1],
+            "unique_id_r": ids[1:],
+            "match_probability": np.ones(num_nodes - 1),
+        }
+    )
+    return nodes, edges
+
+
+def _string_graph():
+    nodes, edges = _random_graph(seed=3)
+    to_str = np.vectorize(lambda i: f"node_{i}")
+    nodes["unique_id"] = to_str(nodes["unique_id"])
+    edges["unique_id_l"] = to_str(edges["unique_id_l"])
+    edges["unique_id_r"] = to_str(edges["unique_id_r"])
+    return nodes, edges
+
+
+GRAPHS = {
+    "random": _random_graph,
+    "chain": _chain_graph,
+    "string_ids": _string_graph,
+}
+
+
+def _reference(nodes, edges, threshold):
+    kept = edges[edges["match_probability"] >= threshold]
+    node_ids, cluster_ids = in_memory.component_labels(
+        nodes["unique_id"], kept["unique_id_l"], kept["unique_id_r"]
+    )
+    return pd.DataFrame({"unique_id": node_ids, "cluster_id": cluster_ids})
+
+
+def _reference_at_thresholds(nodes, edges, thresholds):
+    columns = {}
+    for threshold in thresholds:
+        reference = _reference(nodes, edges, threshold)
+        columns["unique_id"] = reference["unique_id"]
+        columns[mt.threshold_column(threshold)] = reference["cluster_id"]
+    return pd.DataFrame(columns).astype(object)
+
+
+def _by_unique_id(clusters):
+    clusters = clusters.sort_values("unique_id", ignore_index=True)
+    return clusters[["unique_id", "cluster_id"]].astype(object)
+
+
+def _assert_matches_reference(clusters, nodes, edges, threshold=THRESHOLD):
+    pd.testing.assert_frame_equal(
+        _by_unique_id(clusters), _by_unique_id(_reference(nodes, edges, threshold))
+    )
+
+
+def _working_tables(con):
+    return con.execute(
+        """
+        SELECT table_name
+        FROM information_schema.tables
+        WHERE starts_with(table_name, '__cc_')
+        """
+    ).fetchall()
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", cc.ALGORITHMS)
+@pytest.mark.parametrize("reduce_graph", [False, True])
+@pytest.mark.parametrize("remap_ids", [None, True])
+def test_matches_in_memory_reference(graph, algorithm, reduce_graph, remap_ids):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    clusters = cc.cluster(
+        nodes,
+        edges,
+        THRESHOLD,
+        algorithm=algorithm,
+        con=con,
+        remap_ids=remap_ids,
+        reduce_graph=reduce_graph,
+    )
+
+    # Every algorithm labels each cluster with its minimum unique_id, so the
+    # cluster ids match exactly, not just the partition
+    pd.testing.assert_frame_equal(
+        _by_unique_id(clusters), _by_unique_id(_reference(nodes, edges, THRESHOLD))
+    )
+    assert _working_tables(con) == []
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", cc.ALGORITHMS)
+def test_sharded_matches_in_memory_reference(graph, algorithm):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    clusters = sharded.cluster_sharded(
+        nodes, edges, THRESHOLD, num_shards=4, algorithm=algorithm, con=con
+    )
+    _assert_matches_reference(clusters, nodes, edges)
+    assert _working_tables(con) == []
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize(
+    "method, options",
+    [
+        ("sweep", {}),
+        ("incremental", {}),
+        ("incremental", {"algorithm": "pointer_jumping"}),
+        ("independent", {}),
+    ],
+)
+def test_cluster_at_thresholds_matches_reference(graph, method, options):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    clusters = mt.cluster_at_thresholds(
+        nodes, edges, THRESHOLDS, method=method, con=con, **options
+    )
+    pd.testing.assert_frame_equal(
+        clusters.sort_values("unique_id", ignore_index=True).astype(object),
+        _reference_at_thresholds(nodes, edges, THRESHOLDS),
+    )
+    assert _working_tables(con) == []
+
+
+def test_cluster_at_thresholds_in_worker_processes():
+    nodes, edges = _random_graph()
+    clusters = mt.cluster_at_thresholds(
+        nodes, edges, THRESHOLDS, method="independent", processes=2
+    )
+    pd.testing.assert_frame_equal(
+        clusters.astype(object), _reference_at_thresholds(nodes, edges, THRESHOLDS)
+    )
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+def test_cluster_tree_matches_reference(graph):
+    nodes, edges = GRAPHS[graph]()
+    tree = mt.cluster_tree(nodes, edges)
+    assert len(tree) == len(nodes)
+    for threshold in THRESHOLDS:
+        _assert_matches_reference(
+            mt.clusters_at_threshold(tree, threshold), nodes, edges, threshold
+        )
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("ascending", [True, False])
+def test_threshold_ladder_matches_reference(graph, ascending):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    clusters, steps = incremental.cluster_threshold_ladder(
+        nodes, edges, THRESHOLDS, ascending=ascending, con=con
+    )
+    pd.testing.assert_frame_equal(
+        clusters.sort_values("unique_id", ignore_index=True).astype(object),
+        _reference_at_thresholds(nodes, edges, THRESHOLDS),
+    )
+    # The first threshold is clustered in full, not reclustered
+    assert len(steps) == len(THRESHOLDS) - 1
+    assert _working_tables(con) == []
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", ["breadth_first", "in_memory"])
+@pytest.mark.parametrize("new_threshold", [0.3, 0.7])
+def test_recluster_matches_reference(graph, algorithm, new_threshold):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    previous = cc.cluster(nodes, edges, THRESHOLD, con=con)
+    if new_threshold > THRESHOLD:
+        recluster = incremental.recluster_at_higher_threshold
+    else:
+        recluster = incremental.recluster_at_lower_threshold
+    clusters = recluster(
+        previous, edges, new_threshold, THRESHOLD, algorithm=algorithm, con=con
+    )
+    _assert_matches_reference(clusters, nodes, edges, new_threshold)
+    assert _working_tables(con) == []
+
+
+def _split_edges(edges, seed=4):
+    in_first = np.random.default_rng(seed).random(len(edges)) < 0.5
+    return edges[in_first], edges[~in_first]
+
+
+def _with_changes(previous, changes):
+    unchanged = previous[~previous["unique_id"].isin(changes["unique_id"])]
+    return pd.concat([unchanged, changes], ignore_index=True)
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", ["breadth_first", "randomised_contraction"])
+@pytest.mark.parametrize("changes_only", [False, True])
+def test_add_edges_matches_reference(graph, algorithm, changes_only):
+    nodes, edges = GRAPHS[graph]()
+    # The last nodes are only seen in the new edges
+    late = nodes["unique_id"].iloc[-50:]
+    touches_late = edges["unique_id_l"].isin(late) | edges["unique_id_r"].isin(late)
+    first, rest = _split_edges(edges[~touches_late])
+    new_edges = pd.concat([rest, edges[touches_late]], ignore_index=True)
+
+    con = duckdb.connect()
+    previous = cc.cluster(nodes.iloc[:-50], first, THRESHOLD, con=con)
+    clusters = incremental.add_edges(
+        previous,
+        new_edges,
+        THRESHOLD,
+        algorithm=algorithm,
+        changes_only=changes_only,
+        con=con,
+    )
+    if changes_only:
+        clusters = _with_changes(previous, clusters)
+
+    kept = new_edges[new_edges["match_probability"] >= THRESHOLD]
+    seen = nodes[
+        ~nodes["unique_id"].isin(late)
+        | nodes["unique_id"].isin(kept["unique_id_l"])
+        | nodes["unique_id"].isin(kept["unique_id_r"])
+    ]
+    _assert_matches_reference(clusters, seen, edges)
+    assert _working_tables(con) == []
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", ["breadth_first", "pointer_jumping"])
+@pytest.mark.parametrize("changes_only", [False, True])
+def test_remove_edges_matches_reference(graph, algorithm, changes_only):
+    nodes, edges = GRAPHS[graph]()
+    remaining, removed = _split_edges(edges)
+    con = duckdb.connect()
+    previous = cc.cluster(nodes, edges, THRESHOLD, con=con)
+    clusters = incremental.remove_edges(
+        previous,
+        remaining,
+        removed,
+        THRESHOLD,
+        algorithm=algorithm,
+        changes_only=changes_only,
+        con=con,
+    )
+    if changes_only:
+        clusters = _with_changes(previous, clusters)
+    _assert_matches_reference(clusters, nodes, remaining)
+    assert _working_tables(con) == []
+
+
+def _split_a_cluster(clusters):
+    # Moves a node which isn't its cluster's minimum into a cluster of its own
+    moved = clusters.index[clusters["unique_id"] != clusters["cluster_id"]][0]
+    clusters.loc[moved, "cluster_id"] = clusters.loc[moved, "unique_id"]
+    return clusters
+
+
+def _merge_two_clusters(clusters):
+    first, second = clusters["cluster_id"].drop_duplicates().iloc[:2]
+    clusters.loc[clusters["cluster_id"] == second, "cluster_id"] = first
+    return clusters
+
+
+@pytest.mark.parametrize(
+    "change, match, nodes_only_in_one, extra_clusters",
+    [
+        (lambda clusters: clusters, True, 0, 0),
+        (_split_a_cluster, False, 0, 1),
+        (_merge_two_clusters, False, 0, -1),
+        (lambda clusters: clusters.iloc[1:], False, 1, 0),
+    ],
+)
+def test_compare_partitions(change, match, nodes_only_in_one, extra_clusters):
+    nodes, edges = _random_graph()
+    left = _reference(nodes, edges, THRESHOLD)
+    right = change(left.copy())
+    # Only the partition counts, not the cluster ids themselves
+    right["cluster_id"] = right["cluster_id"].astype(str)
+
+    comparison = validation.compare_partitions(left, right)
+    assert comparison["match"] == match
+    assert comparison["nodes_only_in_one"] == nodes_only_in_one
+    assert comparison["clusters_right"] - comparison["clusters_left"] == extra_clusters
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("algorithm", ["breadth_first", "in_memory"])
+@pytest.mark.parametrize("ordered", [False, True])
+@pytest.mark.parametrize("batch_size", [7, 1_000])
+def test_cluster_batches_matches_reference(graph, algorithm, ordered, batch_size):
+    nodes, edges = GRAPHS[graph]()
+    con = duckdb.connect()
+    batches = list(
+        cc.cluster_batches(
+            nodes,
+            edges,
+            THRESHOLD,
+            algorithm=algorithm,
+            con=con,
+            batch_size=batch_size,
+            ordered=ordered,
+        )
+    )
+    assert max(batch.num_rows for batch in batches) <= batch_size
+    clusters = pd.concat([batch.to_pandas() for batch in batches], ignore_index=True)
+    _assert_matches_reference(clusters, nodes, edges)
+    if ordered:
+        pd.testing.assert_frame_equal(
+            clusters.astype(object),
+            _reference(nodes, edges, THRESHOLD)
+            .sort_values(["cluster_id", "unique_id"], ignore_index=True)
+            .astype(object),
+        )
+    assert _working_tables(con) == []
+
+
+def test_cluster_batches_checks_algorithm_before_iterating():
+    nodes, edges = _random_graph()
+    with pytest.raises(ValueError):
+        cc.cluster_batches(nodes, edges, algorithm="no_such_algorithm")
+
+
+def _write_graph(tmp_path, nodes, edges):
+    # Two files of edges, read back through a glob
+    (tmp_path / "edges").mkdir()
+    nodes.to_parquet(tmp_path / "nodes.parquet")
+    first, rest = _split_edges(edges)
+    first.to_parquet(tmp_path / "edges" / "part-0.parquet")
+    rest.to_parquet(tmp_path / "edges" / "part-1.parquet")
+    return str(tmp_path / "nodes.parquet"), str(tmp_path / "edges" / "*.parquet")
+
+
+OUTPUT_FUNCTIONS = {
+    "cluster": lambda nodes, edges, **kwargs: cc.cluster(
+        nodes, edges, THRESHOLD, algorithm="frontier", **kwargs
+    ),
+    "cluster_sharded": lambda nodes, edges, **kwargs: sharded.cluster_sharded(
+        nodes, edges, THRESHOLD, num_shards=3, **kwargs
+    ),
+    # Every node starts as a singleton, so adding all the edges clusters them
+    "add_edges": lambda nodes, edges, **kwargs: incremental.add_edges(
+        kwargs["con"].sql(
+            "SELECT unique_id, unique_id AS cluster_id "
+            f"FROM read_parquet({cc._quote(nodes)})"
+        ),
+        edges,
+        THRESHOLD,
+        **kwargs,
+    ),
+}
+
+
+@pytest.mark.parametrize("graph", GRAPHS)
+@pytest.mark.parametrize("function", OUTPUT_FUNCTIONS)
+def test_parquet_input_and_output(tmp_path, graph, function):
+    nodes, edges = GRAPHS[graph]()
+    nodes_path, edges_path = _write_graph(tmp_path, nodes, edges)
+    # A quote in the path must survive the generated SQL
+    output = str(tmp_path / "it's clustered.parquet")
+
+    con = duckdb.connect()
+    result = OUTPUT_FUNCTIONS[function](nodes_path, edges_path, con=con, output=output)
+    assert result == output
+    clusters = pd.read_parquet(output)
+    _assert_matches_reference(clusters, nodes, edges)
+    assert clusters.equals(
+        clusters.sort_values(["cluster_id", "unique_id"], ignore_index=True)
+    )
+    assert _working_tables(con) == []
+
+
+@pytest.mark.parametrize("use_scipy", [False, True])
+@pytest.mark.parametrize("dangling", [7, -1, 10])
+def test_component_labels_rejects_edge_ends_not_in_nodes(use_scipy, dangling):
+    # Mapped by position alone, 7 would land on node 9 and -1 on node 0
+    with pytest.raises(ValueError, match="not in the nodes"):
+        in_memory.component_labels(
+            [0, 1, 2, 5, 9], [2], [dangling], use_scipy=use_scipy
+        )
+
+
+def test_sweep_rejects_edge_ends_not_in_nodes():
+    nodes = pd.DataFrame({"unique_id": [0, 1, 2, 5, 9]})
+    edges = pd.DataFrame(
+        {"unique_id_l": [2], "unique_id_r": [7], "match_probability": [0.9]}
+    )
+    with pytest.raises(ValueError, match="not in the nodes"):
+        mt.cluster_at_thresholds(nodes, edges, [0.5], method="sweep")
+
+
+@pytest.mark.parametrize("shape", ["power_law", "giant_component", "chain_blobs"])
+@pytest.mark.parametrize(
+    "num_nodes, giant_fraction", [(0, 0.3), (1, 0.3), (100, 0.0), (100, 1.0)]
+)
+def test_generated_graphs_at_extreme_sizes(shape, num_nodes, giant_fraction):
+    chunks = gen.generate_edge_chunks(
+        shape=shape, num_nodes=num_nodes, giant_fraction=giant_fraction
+    )
+    for chunk in chunks:
+        assert chunk["unique_id_l"].between(0, num_nodes - 1).all()
+        assert chunk["unique_id_r"].between(0, num_nodes - 1).all()
+
+
+@pytest.mark.parametrize(
+    "algorithm, options",
+    [
+        ("breadth_first", {}),
+        ("active", {}),
+        ("pointer_jumping", {}),
+        ("randomised_contraction", {"seed": 1, "finish_below": 50}),
+    ],
+)
+def test_interrupted_run_resumes(tmp_path, algorithm, options):
+    nodes, edges = _chain_graph(num_nodes=500)
+    con = duckdb.connect(str(tmp_path / "graph.db"))
+    con.register("nodes_df", nodes)
+    con.register("edges_df", edges)
+    con.execute("CREATE TABLE nodes AS SELECT * FROM nodes_df")
+    con.execute("CREATE TABLE edges AS SELECT * FROM edges_df")
+
+    class Interrupted(Exception):
+        pass
+
+    def interrupt(record):
+        if record["iteration"] == 2:
+            raise Interrupted
+
+    with pytest.raises(Interrupted):
+        cc.cluster(
+            "nodes",
+            "edges",
+            algorithm=algorithm,
+            con=con,
+            run_id="job",
+            on_iteration=interrupt,
+            **options,
+        )
+    assert _working_tables(con) != []
+
+    # Resume on a fresh connection, as after the process was killed
+    con.close()
+    con = duckdb.connect(str(tmp_path / "graph.db"))
+    iterations = []
+    clusters = cc.cluster(
+        "nodes",
+        "edges",
+        algorithm=algorithm,
+        con=con,
+        run_id="job",
+        on_iteration=lambda record: iterations.append(record["iteration"]),
+        **options,
+    )
+
+    assert iterations[0] == 2
+    pd.testing.assert_frame_equal(
+        _by_unique_id(clusters), _by_unique_id(_reference(nodes, edges, 0))
+    )
+    assert _working_tables(con) == []
@@ -3,10 +3,9 @@ import string
 import time
 
 import duckdb
-import networkx as nx  # For validating answer
-import pandas as pd
 
 import generate_random_graphs as gen
+import validation
 
 random.seed(42)  # Set a fixed seed for reproducibility
 
@@ -74,7 +73,10 @@ while changes > 0:
     CREATE OR REPLACE TABLE updated_representatives AS
     SELECT
         n.node_id,
-        MIN(r2.representative) AS representative
+        MIN(r2.representative) AS representative,
+        -- Every node is its own neighbour, so this carries its old representative
+        MIN(r2.representative) < MIN(r2.representative)
+            FILTER (WHERE n.neighbour = n.node_id) AS changed
     FROM neighbours AS n
     LEFT JOIN representatives AS r2
     ON n.neighbour = r2.node_id
@@ -82,20 +84,11 @@ while changes > 0:
     """
     duckdb.execute(update_query)
 
-    # Compare the updated representatives with the current ones
-    # To check for changes, we can count the number of nodes where the representative changed
+    # The update step flags the nodes whose representative changed
     changes_query = """
     SELECT COUNT(*) AS changes
-    FROM (
-        SELECT
-            r.node_id,
-            r.representative AS old_representative,
-            u.representative AS new_representative
-        FROM representatives AS r
-        JOIN updated_representatives AS u
-        ON r.node_id = u.node_id
-        WHERE r.representative <> u.representative
-    ) AS diff
+    FROM updated_representatives
+    WHERE changed
     """
     changes_result = duckdb.execute(changes_query).fetchone()
     changes = changes_result[0]
@@ -123,28 +116,11 @@ execution_time = end_time - start_time
 print(f"Core graph solving algorithm execution time: {execution_time:.2f} seconds")
 
 
-# Validate the clusters using NetworkX
-# Build the graph using NetworkX
-edges_df = duckdb.execute("SELECT unique_id_l, unique_id_r FROM edges").fetchdf()
-G = nx.Graph()
-G.add_edges_from(edges_df.values)
+# Validate the clusters against an in-memory reference clustering
+comparison = validation.validate(our_clusters, nodes, edges_without_self_loops)
 
-# Get the connected components from NetworkX
-nx_components = list(nx.connected_components(G))
-# Assign cluster ids
-nx_cluster_df = pd.DataFrame(
-    [(node, idx) for idx, component in enumerate(nx_components) for node in component],
-    columns=["unique_id", "nx_cluster_id"],
-)
-
-# Merge our clusters with NetworkX clusters
-merged_clusters = our_clusters.merge(nx_cluster_df, on="unique_id")
-
-# Check if the clusterings match
-# Since the cluster IDs may not match, we check that for each of our clusters, the set of nodes matches the corresponding NetworkX cluster
-grouped_our_clusters = merged_clusters.groupby("cluster_id")["nx_cluster_id"].nunique()
-
-if grouped_our_clusters.eq(1).all():
-    print("Clustering matches with NetworkX connected components.")
+if comparison["match"]:
+    print("Clustering matches the reference connected components.")
 else:
-    print("Clustering does not match with NetworkX connected components.")
+    print("Clustering does not match the reference connected components.")
+    print(comparison)
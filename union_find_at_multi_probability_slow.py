@@ -83,7 +83,10 @@ for idx, THRESHOLD_PROBABILITY in enumerate(THRESHOLDS):
         CREATE OR REPLACE TABLE {updated_representatives_table} AS
         SELECT
             n.node_id,
-            MIN(r2.representative) AS representative
+            MIN(r2.representative) AS representative,
+            -- Every node is its own neighbour, so this carries its old representative
+            MIN(r2.representative) < MIN(r2.representative)
+                FILTER (WHERE n.neighbour = n.node_id) AS changed
         FROM {neighbours_table} AS n
         LEFT JOIN {representatives_table} AS r2
         ON n.neighbour = r2.node_id
@@ -91,19 +94,11 @@ for idx, THRESHOLD_PROBABILITY in enumerate(THRESHOLDS):
         """
         duckdb.execute(update_query)
 
-        # Compare the updated representatives with the current ones
+        # The update step flags the nodes whose representative changed
         changes_query = f"""
         SELECT COUNT(*) AS changes
-        FROM (
-            SELECT
-                r.node_id,
-                r.representative AS old_representative,
-                u.representative AS new_representative
-            FROM {representatives_table} AS r
-            JOIN {updated_representatives_table} AS u
-            ON r.node_id = u.node_id
-            WHERE r.representative <> u.representative
-        ) AS diff
+        FROM {updated_representatives_table}
+        WHERE changed
         """
         changes_result = duckdb.execute(changes_query).fetchone()
         changes = changes_result[0]
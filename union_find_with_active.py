@@ -4,11 +4,10 @@ import string
 import time
 
 import duckdb
-import networkx as nx  # For validating answer
-import pandas as pd
 from splink import DuckDBAPI, Linker, SettingsCreator
 
 import generate_random_graphs as gen
+import validation
 
 # random.seed(42)  # Set a fixed seed for reproducibility
 ddb_con = duckdb.connect()
@@ -138,20 +137,17 @@ print(f"Core graph solving algorithm execution time: {execution_time:.2f} second
 our_clusters
 
 
-# Validate the clusters using NetworkX
-# Build the graph using NetworkX
-edges_df = ddb_con.execute("SELECT unique_id_l, unique_id_r FROM edges").fetchdf()
-G = nx.Graph()
-G.add_edges_from(edges_df.values)
-
-# Get the connected components from NetworkX
-nx_components = list(nx.connected_components(G))
-# Assign cluster ids
-nx_cluster_df = pd.DataFrame(
-    [(node, idx) for idx, component in enumerate(nx_components) for node in component],
-    columns=["unique_id", "nx_cluster_id"],
+# Validate the clusters against an in-memory reference clustering
+comparison = validation.validate(
+    our_clusters, nodes, edges_without_self_loops, threshold=0.5, con=ddb_con
 )
 
+if comparison["match"]:
+    print("Clustering matches the reference connected components.")
+else:
+    print("Clustering does not match the reference connected components.")
+    print(comparison)
+
 
 cluster_stats_query = """
 SELECT
@@ -171,24 +167,6 @@ print("Our Cluster Statistics:")
 print(cluster_stats)
 
 
-# Calculate cluster statistics for our method
-our_cluster_stats_query = """
-SELECT
-    COUNT(DISTINCT nx_cluster_id) AS num_clusters,
-    AVG(cluster_size) AS avg_cluster_size,
-    SUM(cluster_size) AS total_nodes
-FROM (
-    SELECT
-        nx_cluster_id,
-        COUNT(*) AS cluster_size
-    FROM nx_cluster_df
-    GROUP BY nx_cluster_id
-)
-"""
-our_cluster_stats = ddb_con.execute(our_cluster_stats_query).fetchdf()
-print("NX Cluster Statistics:")
-print(our_cluster_stats)
-
 # Calculate cluster statistics for Splink's method
 
 db_api = DuckDBAPI(ddb_con)
@@ -2,9 +2,10 @@ import random
 import string
 
 import duckdb
-import networkx as nx  # For validating answer
 import pandas as pd
 
+import validation
+
 random.seed(42)  # Set a fixed seed for reproducibility
 
 
@@ -86,7 +87,10 @@ while changes > 0:
     CREATE OR REPLACE TABLE updated_representatives AS
     SELECT
         n.node_id,
-        MIN(r2.representative) AS representative
+        MIN(r2.representative) AS representative,
+        -- Every node is its own neighbour, so this carries its old representative
+        MIN(r2.representative) FILTER (WHERE n.neighbour = n.node_id)
+            AS old_representative
     FROM neighbours AS n
     LEFT JOIN representatives AS r2
     ON n.neighbour = r2.node_id
@@ -102,26 +106,18 @@ while changes > 0:
         CASE
             WHEN u.representative != u2.representative THEN u2.representative
             ELSE u.representative
-        END AS representative
+        END AS representative,
+        LEAST(u.representative, u2.representative) < u.old_representative AS changed
     FROM updated_representatives u
     LEFT JOIN updated_representatives u2 ON u.representative = u2.node_id
     """
     duckdb.execute(path_compression_query)
 
-    # Compare the compressed representatives with the current ones
-    # To check for changes, we can count the number of nodes where the representative changed
+    # The path compression step flags the nodes whose representative changed
     changes_query = """
     SELECT COUNT(*) AS changes
-    FROM (
-        SELECT
-            r.node_id,
-            r.representative AS old_representative,
-            c.representative AS new_representative
-        FROM representatives AS r
-        JOIN compressed_representatives AS c
-        ON r.node_id = c.node_id
-        WHERE r.representative <> c.representative
-    ) AS diff
+    FROM compressed_representatives
+    WHERE changed
     """
     changes_result = duckdb.execute(changes_query).fetchone()
     changes = changes_result[0]
@@ -144,28 +140,11 @@ ORDER BY cluster_id, unique_id
 our_clusters = duckdb.execute(final_query).fetchdf()
 print(our_clusters)
 
-# Validate the clusters using NetworkX
-# Build the graph using NetworkX
-edges_df = duckdb.execute("SELECT unique_id_l, unique_id_r FROM edges").fetchdf()
-G = nx.Graph()
-G.add_edges_from(edges_df.values)
-
-# Get the connected components from NetworkX
-nx_components = list(nx.connected_components(G))
-# Assign cluster ids
-nx_cluster_df = pd.DataFrame(
-    [(node, idx) for idx, component in enumerate(nx_components) for node in component],
-    columns=["unique_id", "nx_cluster_id"],
-)
-
-# Merge our clusters with NetworkX clusters
-merged_clusters = our_clusters.merge(nx_cluster_df, on="unique_id")
-
-# Check if the clusterings match
-# Since the cluster IDs may not match, we check that for each of our clusters, the set of nodes matches the corresponding NetworkX cluster
-grouped_our_clusters = merged_clusters.groupby("cluster_id")["nx_cluster_id"].nunique()
-
-if grouped_our_clusters.eq(1).all():
-    print("Clustering matches with NetworkX connected components.")
+# Validate the clusters against an in-memory reference clustering
+comparison = validation.validate(our_clusters, nodes, edges_without_self_loops)
+
+if comparison["match"]:
+    print("Clustering matches the reference connected components.")
 else:
-    print("Clustering does not match with NetworkX connected components.")
+    print("Clustering does not match the reference connected components.")
+    print(comparison)
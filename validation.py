@@ -0,0 +1,89 @@
+import duckdb
+
+import connected_components as cc
+
+# Checking clustering results at production scale.
+#
+# The scripts in this repo originally validated their results by building a
+# networkx.Graph, which is slow and memory hungry beyond a million or so
+# edges.  Here two clusterings are compared in SQL instead: they are the same
+# partition if they cover the same nodes and pairing up each node's two
+# cluster ids gives a one-to-one mapping between the clusters.
+
+
+def compare_partitions(left, right, con=None):
+    """Compare two `unique_id, cluster_id` clusterings.
+
+    The cluster ids themselves needn't match, only the partition of the
+    nodes.  `left` and `right` can be DataFrames, Arrow tables or table names
+    on `con`.
+
+    Returns a dict with the number of nodes found in only one clustering, the
+    number of clusters in each, the number of distinct pairs of cluster ids,
+    and whether the partitions `match`.
+    """
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        left_table = ws.register("left", left)
+        right_table = ws.register("right", right)
+        nodes_only_in_one, left_clusters, right_clusters, cluster_pairs = ws.execute(
+            f"""
+        WITH joined AS (
+            SELECT l.cluster_id AS cluster_id_l, r.cluster_id AS cluster_id_r
+            FROM {left_table} AS l
+            FULL OUTER JOIN {right_table} AS r
+            ON l.unique_id = r.unique_id
+        ),
+        pairs AS (
+            SELECT cluster_id_l, cluster_id_r
+            FROM joined
+            WHERE cluster_id_l IS NOT NULL AND cluster_id_r IS NOT NULL
+            GROUP BY cluster_id_l, cluster_id_r
+        )
+        SELECT
+            (SELECT COUNT(*) FROM joined
+             WHERE cluster_id_l IS NULL OR cluster_id_r IS NULL),
+            (SELECT COUNT(DISTINCT cluster_id) FROM {left_table}),
+            (SELECT COUNT(DISTINCT cluster_id) FROM {right_table}),
+            (SELECT COUNT(*) FROM pairs)
+        """
+        ).fetchone()
+    finally:
+        ws.cleanup()
+
+    # Every cluster appears in at least one pair, so with as many pairs as
+    # clusters on each side, each cluster pairs with exactly one other
+    return {
+        "nodes_only_in_one": nodes_only_in_one,
+        "clusters_left": left_clusters,
+        "clusters_right": right_clusters,
+        "cluster_pairs": cluster_pairs,
+        "match": nodes_only_in_one == 0
+        and left_clusters == right_clusters == cluster_pairs,
+    }
+
+
+def partitions_match(left, right, con=None):
+    """Whether two `unique_id, cluster_id` clusterings partition the nodes
+    identically."""
+    return compare_partitions(left, right, con=con)["match"]
+
+
+def validate(clusters, nodes, edges, threshold=None, con=None):
+    """Check `clusters` against the connected components of the graph.
+
+    The reference clustering is computed in memory, see in_memory.py, and
+    compared with `compare_partitions`, whose result is returned.
+    """
+    if con is None:
+        con = duckdb.connect()
+
+    ws = cc._Workspace(con)
+    try:
+        reference = cc._cluster_in_workspace(ws, nodes, edges, threshold, "in_memory")
+        return compare_partitions(clusters, reference, con=con)
+    finally:
+        ws.cleanup()